@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Time the stages of undeux on a synthetic tree, and write the results
+as JSON, so that one version can be compared with another.
+
+    walk            -- walker.scan_tree over the whole tree.
+    group           -- the grouping by size in undeux_main: the files
+                       are added to a CandidateIndex, the singletons
+                       dropped, and the groups read back.
+    fingerprint     -- FileClass.fingerprint of every candidate.
+    fullfingerprint -- FileClass.fullfingerprint of every candidate.
+    hash            -- hash.Hash.hash_files over the candidates.
+    load            -- undeuxdb.load_files of the whole tree into a
+                       new database, as undeux --load does it.
+
+Each stage is run passes times and the fastest is reported. With
+--cold, the candidates are dropped from the page cache before each
+pass of the reading stages. With --baseline, each stage also gets
+the ratio of its time to the time in an earlier result.
+
+    python benchmarks/bench.py --files 20000 -o results.json
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+###
+# The project's modules are one directory up.
+###
+here = os.path.dirname(os.path.abspath(__file__))
+project = os.path.dirname(here)
+sys.path.insert(0, project)
+
+###
+# imports and objects that are a part of this project
+###
+import candidates
+import fileclass
+import fsgenerators
+import hash
+import hashstages
+import iohints
+import shards
+import undeuxdb
+import walker
+
+import synthtree
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+DEFAULT_PASSES = 3
+STAGES = ('walk', 'group', 'fingerprint', 'fullfingerprint', 'hash', 'load')
+
+
+def best_of(passes:int, f:Callable, before:Callable=None) -> tuple:
+    """
+    Run f passes times.
+
+    before -- if given, run untimed before each pass.
+
+    returns -- (fastest time in seconds, what f returned the last time)
+    """
+    best = float('inf')
+    for _ in range(passes):
+        if before is not None: before()
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def walk(root:str, workers:int) -> list:
+    return [(f, st) for f, st in walker.scan_tree(root, workers) if st is not None]
+
+
+def group(entries:list) -> list:
+    """
+    The files in groups of two or more of the same size, as
+    undeux_main finds them.
+    """
+    data = candidates.CandidateIndex()
+    for f, st in entries:
+        if st.st_nlink == 1: data.add(f, st)
+    data.drop_singletons()
+    return [r.name for _, records in data.groups() for r in records]
+
+
+def fingerprint(names:list) -> int:
+    for name in names: fileclass.FileClass(name).fingerprint()
+    return len(names)
+
+
+def fullfingerprint(names:list) -> int:
+    for name in names: fileclass.FileClass(name).fullfingerprint()
+    return len(names)
+
+
+def hash_all(names:list) -> int:
+    return len(hash.Hash().hash_files(names))
+
+
+def load(root:str, workers:int, block:int) -> int:
+    with tempfile.TemporaryDirectory() as d:
+        return undeuxdb.load_files(shards.create_db(os.path.join(d, 'bench.db')),
+            fsgenerators.block_of_files(root, block, workers))
+
+
+def commit() -> str:
+    """
+    The commit being measured, or None if it cannot be found.
+    """
+    with contextlib.suppress(Exception):
+        return subprocess.run(['git', '-C', project, 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    return None
+
+
+def run(root:str, stages:Iterable[str]=STAGES, passes:int=DEFAULT_PASSES,
+    workers:int=walker.DEFAULT_WALKERS, block:int=undeuxdb.DEFAULT_BATCH,
+    cold:bool=False) -> dict:
+    """
+    Time the stages on the tree under root.
+
+    returns -- {stage : {'seconds', 'items', 'bytes', 'items/s', 'MB/s'}}
+    """
+    fileclass.hash_cache = None
+    results = {}
+
+    def record(stage:str, seconds:float, items:int, nbytes:int=0) -> None:
+        results[stage] = {'seconds' : seconds, 'items' : items, 'bytes' : nbytes,
+            'items/s' : items / seconds if seconds else None,
+            'MB/s' : nbytes / seconds / (1 << 20) if seconds and nbytes else None}
+
+    seconds, entries = best_of(passes, lambda : walk(root, workers))
+    if 'walk' in stages: record('walk', seconds, len(entries))
+
+    seconds, names = best_of(passes, lambda : group(entries))
+    if 'group' in stages: record('group', seconds, len(entries))
+
+    sizes = {name : os.stat(name).st_size for name in names}
+    evict = (lambda : [iohints.evict(name) for name in names]) if cold else None
+    for stage, f in (('fingerprint', fingerprint),
+        ('fullfingerprint', fullfingerprint),
+        ('hash', hash_all)):
+        if stage not in stages: continue
+        seconds, items = best_of(passes, lambda : f(names), evict)
+        ###
+        # Counted as the pipeline's stats count them. Every candidate
+        # is a new FileClass here, so the later stages read whole files.
+        ###
+        nbytes = sum(hashstages.bytes_read(s, 'fingerprint', fileclass.FileClass.SAMPLES)
+            if stage == 'fingerprint' else s for s in sizes.values())
+        record(stage, seconds, items, nbytes)
+
+    if 'load' in stages:
+        seconds, rows = best_of(passes, lambda : load(root, workers, block))
+        record('load', seconds, rows)
+
+    return results
+
+
+def compare(results:dict, baseline:dict) -> None:
+    """
+    Add to each stage the ratio of its time to the baseline's; more
+    than 1 is slower.
+    """
+    for stage, r in results.items():
+        if (old := baseline.get('results', {}).get(stage)) and old['seconds']:
+            r['vs baseline'] = r['seconds'] / old['seconds']
+
+
+def bench_main(myargs:argparse.Namespace) -> int:
+    with contextlib.ExitStack() as stack:
+        root = myargs.root
+        tree = None
+        if root is None:
+            root = stack.enter_context(tempfile.TemporaryDirectory(dir=myargs.tmpdir))
+            tree = synthtree.make_tree(root, myargs.files, myargs.depth, myargs.fanout,
+                myargs.median, myargs.sigma, myargs.max_size,
+                myargs.duplicates, myargs.links, myargs.same_size, myargs.seed)
+
+        results = run(root, myargs.stages or STAGES, myargs.passes,
+            myargs.walkers, myargs.load_block, myargs.cold)
+
+    output = {
+        'commit' : commit(),
+        'python' : platform.python_version(),
+        'host' : platform.node(),
+        'cpus' : os.cpu_count(),
+        'when' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'passes' : myargs.passes,
+        'cold' : myargs.cold,
+        'tree' : tree if tree is not None else {'root' : root},
+        'results' : results
+        }
+    if myargs.baseline:
+        with open(myargs.baseline) as f:
+            compare(results, json.load(f))
+
+    text = json.dumps(output, indent=2)
+    if myargs.output:
+        with open(myargs.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="bench",
+        description="Time the stages of undeux on a synthetic tree.")
+    parser.add_argument('--baseline', type=str, default="",
+        help="An earlier result to compare with.")
+    parser.add_argument('--cold', action='store_true',
+        help="Drop the candidates from the page cache before each pass of the reading stages.")
+    parser.add_argument('--depth', type=int, default=synthtree.DEFAULT_DEPTH,
+        help=f"Levels of directories in the tree. Default is {synthtree.DEFAULT_DEPTH}")
+    parser.add_argument('--duplicates', type=float, default=synthtree.DEFAULT_DUPLICATES,
+        help=f"Fraction of files that are copies of others. Default is {synthtree.DEFAULT_DUPLICATES}")
+    parser.add_argument('--fanout', type=int, default=synthtree.DEFAULT_FANOUT,
+        help=f"Subdirectories of each directory. Default is {synthtree.DEFAULT_FANOUT}")
+    parser.add_argument('--files', type=int, default=synthtree.DEFAULT_FILES,
+        help=f"Number of files in the tree. Default is {synthtree.DEFAULT_FILES}")
+    parser.add_argument('--links', type=float, default=synthtree.DEFAULT_LINKS,
+        help=f"Fraction of files that are hard links to others. Default is {synthtree.DEFAULT_LINKS}")
+    parser.add_argument('--load-block', type=int, default=undeuxdb.DEFAULT_BATCH,
+        help=f"Files passed from the walk to the database at a time. Default is {undeuxdb.DEFAULT_BATCH}")
+    parser.add_argument('--max-size', type=int, default=synthtree.DEFAULT_MAX_SIZE,
+        help=f"Largest file, in bytes. Default is {synthtree.DEFAULT_MAX_SIZE}")
+    parser.add_argument('--median', type=int, default=synthtree.DEFAULT_MEDIAN,
+        help=f"Median file size, in bytes. Default is {synthtree.DEFAULT_MEDIAN}")
+    parser.add_argument('-o', '--output', type=str, default="",
+        help="Write the results here rather than to stdout.")
+    parser.add_argument('--passes', type=int, default=DEFAULT_PASSES,
+        help=f"Times each stage is run; the fastest is reported. Default is {DEFAULT_PASSES}")
+    parser.add_argument('--root', type=str, default=None,
+        help="Time an existing tree rather than build one.")
+    parser.add_argument('--same-size', type=float, default=synthtree.DEFAULT_SAME_SIZE,
+        help=f"Fraction of files the same size as another, with different contents. Default is {synthtree.DEFAULT_SAME_SIZE}")
+    parser.add_argument('--seed', type=int, default=0,
+        help="Seed for the tree. Default is 0.")
+    parser.add_argument('--sigma', type=float, default=synthtree.DEFAULT_SIGMA,
+        help=f"Spread of the log-normal sizes. Default is {synthtree.DEFAULT_SIGMA}")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=None,
+        help="Stages to time. Default is all of them.")
+    parser.add_argument('--tmpdir', type=str, default=None,
+        help="Where to build the tree. Default is $TMPDIR.")
+    parser.add_argument('--walkers', type=int, default=walker.DEFAULT_WALKERS,
+        help=f"Number of directories listed concurrently. Default is {walker.DEFAULT_WALKERS}")
+
+    myargs = parser.parse_args()
+    sys.exit(bench_main(myargs))
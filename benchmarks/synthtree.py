@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Build a synthetic directory tree for benchmarking undeux. The same
+arguments and seed always give the same tree.
+
+Each file is one of:
+
+    original  -- new contents, with a size drawn from a log-normal
+                 distribution around the median.
+    duplicate -- a copy of an earlier original, in another directory.
+    link      -- a hard link to an earlier original.
+    same size -- an earlier original's size and contents, with a few
+                 bytes changed in the interior, away from the blocks
+                 that fingerprint() and sampled_fingerprint() read, so
+                 only the full hash or the lockstep comparison can tell
+                 the files apart. A file no larger than two
+                 FileClass.HASHBLOCKs has no such interior, and its
+                 last bytes are changed instead.
+
+The files are spread at random over a tree of directories fanout
+wide and depth deep.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import json
+import math
+import random
+import shutil
+
+###
+# The project's modules are one directory up.
+###
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+###
+# imports and objects that are a part of this project
+###
+from   fileclass import FileClass
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+DEFAULT_FILES = 10000
+DEFAULT_DEPTH = 3
+DEFAULT_FANOUT = 8
+DEFAULT_MEDIAN = 1 << 16
+DEFAULT_SIGMA = 2.0
+DEFAULT_MAX_SIZE = 1 << 26
+DEFAULT_DUPLICATES = 0.10
+DEFAULT_LINKS = 0.02
+DEFAULT_SAME_SIZE = 0.05
+
+###
+# The number of bytes changed in a same size file.
+###
+TAIL = 8
+
+
+def make_dirs(root:str, depth:int, fanout:int) -> list:
+    """
+    Create root and a tree beneath it, fanout directories wide at each
+    of depth levels.
+
+    returns -- every directory, root included.
+    """
+    dirs = [root]
+    level = [root]
+    for d in range(depth):
+        level = [os.path.join(parent, f"d{d}_{i}") for parent in level for i in range(fanout)]
+        dirs.extend(level)
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    return dirs
+
+
+def unread_offset(size:int, samples:int=FileClass.SAMPLES) -> Optional[int]:
+    """
+    Where to change TAIL bytes of a file of this size so that neither
+    fingerprint() nor sampled_fingerprint(samples) sees the change:
+    the middle of the widest gap between the blocks they read.
+
+    returns -- the offset, or None if there is no gap wide enough.
+    """
+    head, block = FileClass.HASHBLOCK, FileClass.SAMPLEBLOCK
+    first = head
+    last = max(first, size - head - block)
+    read = sorted([(0, head), (size - head, size)] +
+        [(o, o + block) for o in (first + (last - first) * i // (samples+1)
+            for i in range(1, samples+1))])
+
+    best, where, end = 0, None, 0
+    for start, stop in read:
+        if start - end > best: best, where = start - end, end
+        end = max(end, stop)
+    if best < TAIL: return None
+    return where + (best - TAIL) // 2
+
+
+def make_tree(root:str,
+    files:int=DEFAULT_FILES,
+    depth:int=DEFAULT_DEPTH,
+    fanout:int=DEFAULT_FANOUT,
+    median:int=DEFAULT_MEDIAN,
+    sigma:float=DEFAULT_SIGMA,
+    max_size:int=DEFAULT_MAX_SIZE,
+    duplicates:float=DEFAULT_DUPLICATES,
+    links:float=DEFAULT_LINKS,
+    same_size:float=DEFAULT_SAME_SIZE,
+    seed:int=0) -> dict:
+    """
+    Build the tree under root, which must not already hold files.
+
+    duplicates, links, same_size -- the fraction of the files of each
+        kind. The rest are originals.
+
+    returns -- the arguments, and the number of files and bytes of
+        each kind.
+    """
+    if duplicates + links + same_size >= 1.0:
+        raise ValueError("duplicates, links, and same_size must leave room for originals.")
+
+    rng = random.Random(seed)
+    spec = {'root' : root, 'files' : files, 'depth' : depth, 'fanout' : fanout,
+        'median' : median, 'sigma' : sigma, 'max_size' : max_size,
+        'duplicates' : duplicates, 'links' : links, 'same_size' : same_size, 'seed' : seed}
+    dirs = make_dirs(root, depth, fanout)
+    counts = dict.fromkeys(('original', 'duplicate', 'link', 'same size'), 0)
+    sizes = dict.fromkeys(counts, 0)
+    originals = []
+
+    for i in range(files):
+        r = rng.random()
+        kind = ('duplicate' if r < duplicates else
+            'link' if r < duplicates + links else
+            'same size' if r < duplicates + links + same_size else
+            'original')
+        if not originals: kind = 'original'
+
+        name = os.path.join(rng.choice(dirs), f"f{i}")
+        if kind == 'original':
+            size = min(int(rng.lognormvariate(math.log(median), sigma)), max_size)
+            with open(name, 'wb') as f:
+                f.write(rng.randbytes(size))
+            originals.append((name, size))
+        else:
+            source, size = rng.choice(originals)
+            if kind == 'link':
+                os.link(source, name)
+            else:
+                shutil.copyfile(source, name)
+                if kind == 'same size' and size:
+                    n = min(TAIL, size)
+                    where = unread_offset(size)
+                    if where is None: where = size - n
+                    with open(name, 'r+b') as f:
+                        f.seek(where)
+                        old = f.read(n)
+                        f.seek(where)
+                        f.write(bytes(b ^ 0xff for b in old))
+
+        counts[kind] += 1
+        sizes[kind] += size
+
+    spec['dirs'] = len(dirs)
+    spec['counts'] = counts
+    spec['bytes'] = sizes
+    return spec
+
+
+def synthtree_main(myargs:argparse.Namespace) -> int:
+    if os.path.exists(myargs.root) and os.listdir(myargs.root):
+        print(f"{myargs.root} is not empty.", file=sys.stderr)
+        return os.EX_CANTCREAT
+
+    spec = make_tree(myargs.root, myargs.files, myargs.depth, myargs.fanout,
+        myargs.median, myargs.sigma, myargs.max_size,
+        myargs.duplicates, myargs.links, myargs.same_size, myargs.seed)
+    print(json.dumps(spec, indent=2))
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="synthtree",
+        description="Build a reproducible tree of files for benchmarking undeux.")
+    parser.add_argument('root', type=str,
+        help="Directory to build the tree in. It must be empty or absent.")
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH,
+        help=f"Levels of directories below root. Default is {DEFAULT_DEPTH}")
+    parser.add_argument('--duplicates', type=float, default=DEFAULT_DUPLICATES,
+        help=f"Fraction of files that are copies of others. Default is {DEFAULT_DUPLICATES}")
+    parser.add_argument('--fanout', type=int, default=DEFAULT_FANOUT,
+        help=f"Subdirectories of each directory. Default is {DEFAULT_FANOUT}")
+    parser.add_argument('--files', type=int, default=DEFAULT_FILES,
+        help=f"Number of files. Default is {DEFAULT_FILES}")
+    parser.add_argument('--links', type=float, default=DEFAULT_LINKS,
+        help=f"Fraction of files that are hard links to others. Default is {DEFAULT_LINKS}")
+    parser.add_argument('--max-size', type=int, default=DEFAULT_MAX_SIZE,
+        help=f"Largest file, in bytes. Default is {DEFAULT_MAX_SIZE}")
+    parser.add_argument('--median', type=int, default=DEFAULT_MEDIAN,
+        help=f"Median size of the originals, in bytes. Default is {DEFAULT_MEDIAN}")
+    parser.add_argument('--same-size', type=float, default=DEFAULT_SAME_SIZE,
+        help=f"Fraction of files the same size as another, with different contents. Default is {DEFAULT_SAME_SIZE}")
+    parser.add_argument('--seed', type=int, default=0,
+        help="Seed for the random choices. Default is 0.")
+    parser.add_argument('--sigma', type=float, default=DEFAULT_SIGMA,
+        help=f"Spread of the log-normal sizes. Default is {DEFAULT_SIGMA}")
+
+    myargs = parser.parse_args()
+    sys.exit(synthtree_main(myargs))
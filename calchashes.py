@@ -17,22 +17,31 @@ if sys.version_info < min_py:
 # Other standard distro imports
 ###
 import argparse
+import collections
 import contextlib
 import getpass
 mynetid = getpass.getuser()
+import itertools
 import logging
+import multiprocessing
+import textwrap
+import time
 
 ###
 # From hpclib
 ###
-import linuxutils
 import sqlitedb
 from   urdecorators import trap
 
 ###
 # imports and objects that are a part of this project
 ###
+import dupgroups
 import hash
+import hashcache
+import iohints
+import partition
+import rescan
 import undeuxdb
 import urlogger
 
@@ -53,39 +62,159 @@ __status__ = 'in progress'
 __license__ = 'MIT'
 
 
+###
+# Buckets are numbered 0-99. The parent fetches the work for this
+# many buckets with each query.
+###
+BUCKETS_PER_QUERY = 5
+
+
+###
+# Files in the given buckets that have a same-sized partner and no
+# row in hashes, found with a single anti-join. The partners are
+# looked up in size_groups rather than by grouping metadata.
+###
+unhashed_statement = lambda n : textwrap.dedent(f"""
+    SELECT m.rowid, m.directory_name, m.filename, m.inode, m.filesize
+    FROM metadata AS m
+    WHERE m.bucket IN ({','.join('?'*n)})
+        AND NOT m.deleted
+        AND m.filesize > 0
+        AND m.filesize IN (SELECT filesize FROM size_groups)
+        AND NOT EXISTS (
+            SELECT 1 FROM hashes AS h WHERE h.file_id = m.rowid);
+    """).strip()
+
+insert_hash_statement = textwrap.dedent("""
+    INSERT INTO hashes (file_id, hash) VALUES (?, ?);
+    """).strip()
+
+###
+# Each worker process has its own hasher, and with it its own buffer.
+###
+hasher = None
+
+def worker_init() -> None:
+    """
+    Runs once in each worker process.
+    """
+    global hasher
+    os.system(f"ionice -t -c 3 -n 0 -p {os.getpid()}")
+    hasher = hash.Hash()
+
+
+def hash_one(task:tuple) -> tuple:
+    """
+    Runs in a worker process, and never touches the database.
+
+    task -- (file_id, filename, size, cache candidates). A candidate is
+        (device, size, mtime, ctime, fullhash), as found by
+        HashCache.candidates().
+
+    returns -- (file_id, hash, facts, cached) where facts is
+        (device, inode, size, mtime, ctime), or None if the file
+        could not be stat-ed, and cached tells whether the hash came
+        from a candidate rather than from reading the file.
+    """
+    file_id, filename, _, candidates = task
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return file_id, hash.ZERO_HASH, None, False
+
+    facts = (st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+    for dev, size, mtime, ctime, fullhash in candidates:
+        if (dev, size, mtime, ctime) == (st.st_dev, st.st_size, st.st_mtime, st.st_ctime):
+            return file_id, fullhash, facts, True
+
+    return file_id, hasher.hash_file(filename), facts, False
+
+
+def hash_unit(unit:list) -> list:
+    """
+    Runs in a worker process: one unit of work from partition.work_units.
+    """
+    return [hash_one(task) for task in unit]
+
+
+def unhashed_tasks(db:sqlitedb.SQLiteDB, buckets:tuple, cache:hashcache.HashCache) -> list:
+    """
+    Runs in the parent. The tasks for the unhashed files in buckets.
+    """
+    rows = db.execute_SQL(unhashed_statement(len(buckets)), *buckets)
+    candidates = {} if cache is None else cache.candidates({row[3] for row in rows})
+    return [ (file_id, os.path.join(dirname, filename), size, candidates.get(inode, ()))
+        for file_id, dirname, filename, inode, size in rows ]
+
+
 @trap
-def hash_files_by_bucket(db:sqlitedb.SQLiteDB, buckets:tuple) -> bool:
+def hash_files_by_bucket(db:sqlitedb.SQLiteDB,
+    buckets:Iterable[int],
+    cores:int=1,
+    cache:hashcache.HashCache=None) -> collections.Counter:
     """
-    Calculate the hashes of probable duplicates, considering only
-    files in the assigned bucket.
+    Calculate the hashes of probable duplicates in the given buckets.
+    The parent process is the only one with a database connection: it
+    queries the work, the workers hash, and the results are written
+    in bulk as they arrive.
+
+    The rows of dup_groups for the sizes in each range are rebuilt
+    as soon as the range is written.
+
+    returns -- counts of files hashed, files found in the cache,
+        files that could not be read, and bytes read.
     """
-    SQL = f"SELECT * from duplicates where bucket in {buckets} limit 5"
-    # SQL = f"SELECT * from possible_duplicates where bucket in {buckets} limit 1"
-    logger.debug(f"{SQL=}")
-    rows = db.execute_SQL(SQL)
-    logger.debug(f"{rows=}")
-
-    for row in rows:
-        # Make sure it has not already been done!
-        SQL = f"SELECT * FROM hashes WHERE file_id = {row[-1]}"
-        logger.debug(f"{SQL=}")
-        result = db.execute_SQL(SQL)
-        logger.debug(f"{result=}")
-        if len(result):
-            logger.info(f"{row[-1]} is already hashed.")
-            continue
-        
-        hasher = hash.Hash()
-        filename = os.path.join(row[1], row[0])
-        logger.debug(f"hashing {filename}")
-        result = hasher.hash_file(filename)
-        logger.debug(f"{result=}")
-        SQL = """
-            INSERT INTO hashes (file_id, hash) VALUES (?, ?)       
-            """
-        logger.debug(SQL)
-        db.execute_SQL(SQL, row[-1], result)
-        logger.debug(f"hash added.")
+    stats = collections.Counter()
+    buckets = tuple(buckets)
+    ranges = [buckets[i:i+BUCKETS_PER_QUERY]
+        for i in range(0, len(buckets), BUCKETS_PER_QUERY)]
+
+    dupgroups.prepare(db)
+    start = time.perf_counter()
+    with multiprocessing.Pool(cores, initializer=worker_init) as pool, \
+        undeuxdb.BulkWriter(db, insert_hash_statement) as writer:
+
+        ###
+        # The next range is queried and queued before the results of
+        # the current one are consumed, so the workers are not idle
+        # while the parent is in SQLite. The pool hands out one unit
+        # at a time to whichever worker is free, and the largest units
+        # go first, so the workers finish together.
+        ###
+        pending = None
+        for r in ranges + [None]:
+            following = None
+            if r is not None:
+                tasks = unhashed_tasks(db, r, cache)
+                logger.debug(f"buckets {r}: {len(tasks)} files to hash.")
+                units = partition.work_units(tasks, lambda t : t[2])
+                following = pool.imap_unordered(hash_unit, units, 1), {t[2] for t in tasks}
+
+            if pending is not None:
+                pending, sizes = pending
+                stored, seen = [], []
+                for file_id, result, facts, cached in itertools.chain.from_iterable(pending):
+                    writer.add((file_id, result))
+                    if facts is None or result == hash.ZERO_HASH:
+                        stats['unreadable'] += 1
+                    elif cached:
+                        stats['cached'] += 1
+                        seen.append(facts[:2])
+                    else:
+                        stats['hashed'] += 1
+                        stats['bytes'] += facts[2]
+                        stored.append((*facts, result))
+                if cache is not None: cache.store_full(stored, seen)
+                writer.flush()
+                dupgroups.refresh_groups(db, sizes)
+
+            pending = following
+
+    elapsed = time.perf_counter() - start
+    files = stats['hashed'] + stats['cached']
+    logger.info(f"{files} files in {elapsed:.2f}s; {files/elapsed:.1f} files/s, "
+        f"{stats['bytes']/elapsed/(1<<20):.1f} MB/s with {cores} cores.")
+    return stats
 
 
 @trap
@@ -94,22 +223,32 @@ def calchashes_main(myargs:argparse.Namespace) -> int:
     code_version = os.path.getmtime(os.path.abspath(__file__))
     db = undeuxdb.open_and_check_db(myargs.db, code_version)
     logger.info(f"{myargs.db} is open")
+    iohints.enabled = myargs.fadvise
+    cache = None if myargs.no_cache else hashcache.HashCache(db, myargs.cache_runs)
 
-    pids = set()
-    for bucket_range in linuxutils.splitter(tuple(range(100)), myargs.cores):
-        if (pid := os.fork()):
-            pids.add(pid)
-            continue
+    ###
+    # A metadata table from before the deleted column was added is
+    # brought up to date before anything filters on it.
+    ###
+    rescan.prepare(db)
 
-        try:
-            os.system(f"ionice -t -c 3 -n 0 -p {os.getpid()}")
-            hash_files_by_bucket(db, bucket_range)
-        finally:
-            os._exit(0)
+    ###
+    # Buckets are normally assigned when the files are loaded, but a
+    # database filled some other way may not have them.
+    ###
+    dupgroups.prepare(db)
+    if not db.execute_SQL("SELECT COUNT(*) FROM size_groups;")[0][0]:
+        logger.info(f"{dupgroups.refresh_sizes(db)} sizes shared by more than one file.")
+    if myargs.repartition or partition.unassigned(db):
+        totals = partition.assign_buckets(db)
+        logger.info(f"buckets assigned; the largest holds {max(totals)} bytes, the smallest {min(totals)}.")
 
-    while pids:
-        pid, exit_code, _ = os.wait3(0)
-        pids.remove(pid)
+    stats = hash_files_by_bucket(db, range(partition.DEFAULT_BUCKETS), myargs.cores, cache)
+    logger.info(f"{dict(stats)}")
+    groups, files, wasted = dupgroups.totals(db)
+    logger.info(f"{groups} duplicate groups holding {files} files; {wasted} bytes wasted.")
+    if cache is not None:
+        logger.info(f"hash cache: {stats['cached']} hits, {cache.evict()} stale entries evicted.")
 
     return os.EX_OK
 
@@ -119,12 +258,20 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog="calchashes", 
         description="What calchashes does, calchashes does best.")
 
+    parser.add_argument('--cache-runs', type=int, default=hashcache.DEFAULT_KEEP_RUNS,
+        help=f"Forget cached hashes of files not seen in this many runs. Default is {hashcache.DEFAULT_KEEP_RUNS}")
     parser.add_argument('-c', '--cores', type=int, default=1,
         help="Number of cores to use for calculating hashes.")
     parser.add_argument('--db', type=str, default="",
         help="Name of the database with files to scan.")
+    parser.add_argument('--fadvise', action='store_true',
+        help="Keep hashing from flooding the page cache.")
+    parser.add_argument('--no-cache', action='store_true',
+        help="Neither use nor update the persistent hash cache.")
     parser.add_argument('-o', '--output', type=str, default="",
         help="Output file name")
+    parser.add_argument('--repartition', action='store_true',
+        help="Reassign the buckets by bytes to hash before starting.")
     parser.add_argument('-v', '--verbose', action='store_true',
         help="Be chatty about what is taking place")
 
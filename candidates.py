@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+A compact in-memory index of the files that might be duplicates.
+Rather than one Python string (and one list slot) per file, the
+index keeps an interned table of directory names and a set of
+parallel typed arrays, so each file costs a few dozen bytes no
+matter how long its name is.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+from   array import array
+import collections
+import itertools
+import resource
+
+###
+# Installed libraries.
+###
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+###
+# From hpclib
+###
+
+###
+# imports and objects that are a part of this project
+###
+from   fileclass import FileRecord
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def peak_rss_mb() -> float:
+    """
+    The high water mark of this process's resident set, in MB.
+    Linux reports ru_maxrss in kilobytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class CandidateIndex:
+    """
+    Files grouped by size, stored column-wise.
+
+    Row i of the index is the file whose directory is
+    dirs[dir_id[i]], whose name is names[name_offset[i]:name_offset[i+1]],
+    and whose metadata are size[i], inode[i], device[i], mtime[i],
+    nlinks[i], and ctime[i].
+    """
+
+    def __init__(self) -> None:
+        self.dir_ids = {}
+        self.dirs = []
+        self.names = bytearray()
+        self.dir_id = array('I')
+        self.name_offset = array('Q', [0])
+        self.size = array('q')
+        self.inode = array('Q')
+        self.device = array('Q')
+        self.mtime = array('d')
+        self.nlinks = array('I')
+        self.ctime = array('d')
+        self.order = None
+        self.counts = None
+        self.distinct_sizes = 0
+        self.group_count = 0
+
+
+    def __len__(self) -> int:
+        return len(self.size)
+
+
+    def add(self, path:str, stats:os.stat_result) -> None:
+        """
+        Add one file.
+
+        path -- the file's complete name.
+        stats -- an os.stat_result, or anything with the same st_ fields.
+        """
+        d, f = os.path.split(path)
+        if (i := self.dir_ids.get(d)) is None:
+            i = self.dir_ids[d] = len(self.dirs)
+            self.dirs.append(d)
+
+        self.dir_id.append(i)
+        self.names.extend(os.fsencode(f))
+        self.name_offset.append(len(self.names))
+        self.size.append(stats.st_size)
+        self.inode.append(stats.st_ino)
+        self.device.append(stats.st_dev)
+        self.mtime.append(stats.st_mtime)
+        self.nlinks.append(stats.st_nlink)
+        self.ctime.append(stats.st_ctime)
+        self.order = None
+        self.counts = None
+
+
+    def record(self, i:int) -> FileRecord:
+        """
+        Materialize row i as a FileRecord.
+        """
+        name = os.fsdecode(bytes(self.names[self.name_offset[i]:self.name_offset[i+1]]))
+        return FileRecord(os.path.join(self.dirs[self.dir_id[i]], name),
+            self.size[i], self.inode[i], self.device[i], self.mtime[i], self.nlinks[i],
+            self.ctime[i])
+
+
+    def columns(self) -> tuple:
+        """
+        The per-file arrays, other than the names.
+        """
+        return (self.dir_id, self.size, self.inode, self.device, self.mtime,
+            self.nlinks, self.ctime)
+
+
+    def count_sizes(self) -> tuple:
+        """
+        The distinct sizes, ascending, and the number of files of each.
+        They are counted once and kept until a file is added. With
+        NumPy, both are arrays, and there is no Python object per size.
+
+        returns -- (sizes, counts)
+        """
+        if self.counts is None:
+            if np is not None:
+                self.counts = np.unique(np.frombuffer(self.size, dtype=np.int64),
+                    return_counts=True)
+            else:
+                c = collections.Counter(self.size)
+                sizes = sorted(c)
+                self.counts = sizes, [c[sz] for sz in sizes]
+        return self.counts
+
+
+    def drop_singletons(self) -> int:
+        """
+        Remove every file whose size is unique in the index, compacting
+        the arrays in place.
+
+        returns -- the number of files remaining.
+        """
+        sizes, counts = self.count_sizes()
+        self.distinct_sizes = len(sizes)
+        if np is not None:
+            shared = counts > 1
+            self.counts = sizes[shared], counts[shared]
+            keep = np.isin(np.frombuffer(self.size, dtype=np.int64), self.counts[0])
+            kept = int(np.count_nonzero(keep))
+            for a in self.columns():
+                v = np.frombuffer(a, dtype=a.typecode)
+                v[:kept] = v[keep]
+                del v
+
+            lengths = np.diff(np.frombuffer(self.name_offset, dtype=np.uint64)).astype(np.int64)
+            self.names = bytearray(np.frombuffer(self.names, dtype=np.uint8)[
+                np.repeat(keep, lengths)].tobytes())
+            self.name_offset = array('Q', [0])
+            self.name_offset.frombytes(np.cumsum(lengths[keep], dtype=np.uint64).tobytes())
+
+        else:
+            shared = {sz for sz, n in zip(sizes, counts) if n > 1}
+            self.counts = sorted(shared), [n for n in counts if n > 1]
+            kept = 0
+            names = bytearray()
+            offsets = array('Q', [0])
+            for i, sz in enumerate(self.size):
+                if sz not in shared: continue
+                for a in self.columns():
+                    a[kept] = a[i]
+                names.extend(self.names[self.name_offset[i]:self.name_offset[i+1]])
+                offsets.append(len(names))
+                kept += 1
+            self.names = names
+            self.name_offset = offsets
+
+        for a in self.columns():
+            del a[kept:]
+        self.group_count = len(self.counts[0])
+        self.order = None
+        return kept
+
+
+    def _build_order(self) -> tuple:
+        """
+        Sort the row numbers by descending size into self.order.
+
+        returns -- (sizes, starts), each size, largest first, and its
+            starting position in self.order.
+        """
+        sizes, counts = self.count_sizes()
+        sizes, counts = sizes[::-1], counts[::-1]
+        if np is not None:
+            order = np.argsort(-np.frombuffer(self.size, dtype=np.int64), kind='stable')
+            self.order = array('Q')
+            self.order.frombytes(order.astype(np.uint64).tobytes())
+            return sizes, np.cumsum(counts) - counts
+
+        ###
+        # A counting sort.
+        ###
+        starts = list(itertools.accumulate(counts, initial=0))[:-1]
+        fill = dict(zip(sizes, starts))
+        self.order = array('Q', bytes(8 * len(self.size)))
+        for i, sz in enumerate(self.size):
+            self.order[fill[sz]] = i
+            fill[sz] += 1
+        return sizes, starts
+
+
+    def groups(self) -> Iterator[tuple]:
+        """
+        A generator of (size, [FileRecord, ... ]) for each distinct
+        size, largest first. Only one group's records exist at a time.
+        """
+        sizes, starts = self._build_order()
+        ends = itertools.chain(starts[1:], [len(self.order)])
+        for sz, start, end in zip(sizes, starts, ends):
+            yield int(sz), [self.record(self.order[j]) for j in range(start, end)]
+
+
+    def largest_group(self) -> tuple:
+        """
+        returns -- (size, member_count) for the most populous size.
+        """
+        sizes, counts = self.count_sizes()
+        if not len(sizes): return 0, 0
+        i = int(np.argmax(counts)) if np is not None else counts.index(max(counts))
+        return int(sizes[i]), int(counts[i])
+
+
+    def close(self) -> None:
+        """
+        Nothing to release; present so that CandidateIndex and
+        extsort.SpillIndex are interchangeable.
+        """
+        pass
+
+
+class InodeGroups:
+    """
+    The paths that share an inode. Only the first path seen for each
+    (st_dev, st_ino) goes into the index to be hashed; the others are
+    remembered here, so an inode is read once however many links it
+    has, and every one of its paths can be reported.
+
+    Only files with more than one link need be offered, so the dict
+    stays small unless the tree is made mostly of hard links.
+    """
+
+    def __init__(self) -> None:
+        self.links = {}
+        self.extra = 0
+        self.extra_bytes = 0
+
+
+    def add(self, path:str, stats:os.stat_result) -> bool:
+        """
+        returns -- True if path is the first seen for its inode, and
+            should be indexed.
+        """
+        key = stats.st_dev, stats.st_ino
+        if (paths := self.links.get(key)) is None:
+            self.links[key] = [path]
+            return True
+        paths.append(path)
+        self.extra += 1
+        self.extra_bytes += stats.st_size
+        return False
+
+
+    def paths(self, f:object) -> list:
+        """
+        Every path of f's inode, f's own first. f is anything with a
+        name and inodedata, such as a FileClass.
+        """
+        st = f.inodedata
+        return self.links.get((st.st_dev, st.st_ino), [f.name])
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints for long runs of undeux, so that a job killed at its
+time limit can pick up where it stopped rather than start over.
+
+During the walk, the directories whose listings have been consumed,
+the directories found but not yet listed (the frontier), and the
+candidate files found so far are saved together, in one transaction.
+A resumed walk replays the saved files and lists only the frontier.
+
+During hashing, the sizes whose groups have been finished are saved
+along with the rows already written for them. Rows written for sizes
+that were not finished are removed when the run resumes. Within an
+unfinished batch, the hash cache remembers whatever was hashed.
+
+Saves are made no more often than every interval seconds, and the
+interval grows if the saves cost more than max_overhead of the
+elapsed time.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import textwrap
+import time
+
+###
+# From hpclib
+###
+import sqlitedb
+
+###
+# imports and objects that are a part of this project
+###
+from   fileclass import FileRecord
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+DEFAULT_INTERVAL = 300
+MAX_OVERHEAD = 0.02
+
+###
+# The clock is consulted once every this many calls to tick().
+###
+TICKS = 1024
+
+checkpoint_statements = (
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS checkpoint_runs (
+        run_id INTEGER PRIMARY KEY,
+        dirs TEXT UNIQUE,
+        table_name TEXT,
+        phase TEXT,
+        started DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """).strip(),
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS checkpoint_dirs (
+        run_id INTEGER,
+        dirname TEXT,
+        done INTEGER,
+        PRIMARY KEY (run_id, dirname)
+        ) WITHOUT ROWID;
+    """).strip(),
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS checkpoint_files (
+        run_id INTEGER,
+        path TEXT,
+        filesize INTEGER,
+        inode INTEGER,
+        device INTEGER,
+        mtime REAL,
+        nlinks INTEGER,
+        ctime REAL
+        );
+    """).strip(),
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS checkpoint_sizes (
+        run_id INTEGER,
+        filesize INTEGER,
+        PRIMARY KEY (run_id, filesize)
+        ) WITHOUT ROWID;
+    """).strip()
+    )
+
+found_dir_statement = textwrap.dedent("""
+    INSERT OR IGNORE INTO checkpoint_dirs (run_id, dirname, done) VALUES (?, ?, 0);
+    """).strip()
+
+done_dir_statement = textwrap.dedent("""
+    INSERT OR REPLACE INTO checkpoint_dirs (run_id, dirname, done) VALUES (?, ?, 1);
+    """).strip()
+
+keep_file_statement = textwrap.dedent("""
+    INSERT INTO checkpoint_files
+        (run_id, path, filesize, inode, device, mtime, nlinks, ctime)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+    """).strip()
+
+done_size_statement = textwrap.dedent("""
+    INSERT OR IGNORE INTO checkpoint_sizes (run_id, filesize) VALUES (?, ?);
+    """).strip()
+
+run_tables = ('checkpoint_dirs', 'checkpoint_files', 'checkpoint_sizes', 'checkpoint_runs')
+
+
+class Checkpoint:
+    """
+    The saved progress of one run, identified by the directories it
+    scans.
+
+    ckpt = Checkpoint(db, dirs, table_name)
+    for f, st in walker.scan_tree(ckpt.frontier(), lister=ckpt.lister(list_directory)):
+        ckpt.keep(f, st)
+        ckpt.tick()
+    ckpt.begin_hashing()
+    ...
+    ckpt.finish()
+    """
+
+    def __init__(self, db:sqlitedb.SQLiteDB,
+        dirs:Iterable[str],
+        table_name:str,
+        interval:float=DEFAULT_INTERVAL,
+        max_overhead:float=MAX_OVERHEAD,
+        fresh:bool=False) -> None:
+        """
+        db -- the open database.
+        dirs -- the directories being scanned. A saved run for the same
+            directories is resumed unless fresh is True.
+        table_name -- the table of results. A resumed run keeps the
+            name it started with, even if the date has changed.
+        interval -- the least number of seconds between saves.
+        max_overhead -- the fraction of the elapsed time that saves
+            may take before the interval is lengthened.
+        """
+        self.db = db
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.key = "\n".join(sorted(dirs))
+        self.found = []
+        self.done = []
+        self.kept = []
+        self.current = []
+        self.sizes = []
+        self.ticks = 0
+        self.saves = 0
+        self.cost = 0.0
+        self.started = self.last = time.perf_counter()
+        for statement in checkpoint_statements:
+            db.execute_SQL(statement)
+
+        row = db.execute_SQL(
+            "SELECT run_id, table_name, phase FROM checkpoint_runs WHERE dirs = ?;", self.key)
+        if row and fresh:
+            self.discard(row[0][0])
+            row = None
+
+        if row:
+            self.run_id, self.table_name, self.phase = row[0]
+            self.resumed = True
+        else:
+            db.execute_SQL("INSERT INTO checkpoint_runs (dirs, table_name, phase) VALUES (?, ?, 'walk');",
+                self.key, table_name)
+            self.run_id = db.execute_SQL("SELECT run_id FROM checkpoint_runs WHERE dirs = ?;",
+                self.key)[0][0]
+            self.table_name, self.phase = table_name, 'walk'
+            self.resumed = False
+            self.found = [(self.run_id, d) for d in dirs]
+            self.save()
+
+
+    def discard(self, run_id:int) -> None:
+        for table in run_tables:
+            self.db.execute_SQL(f"DELETE FROM {table} WHERE run_id = ?;", run_id)
+        self.db.commit()
+
+
+    def frontier(self) -> list:
+        """
+        The directories that remain to be listed.
+        """
+        return [row[0] for row in self.db.execute_SQL(
+            "SELECT dirname FROM checkpoint_dirs WHERE run_id = ? AND NOT done;", self.run_id)]
+
+
+    def finished_dirs(self) -> list:
+        return [row[0] for row in self.db.execute_SQL(
+            "SELECT dirname FROM checkpoint_dirs WHERE run_id = ? AND done;", self.run_id)]
+
+
+    def stored_files(self) -> Iterator[tuple]:
+        """
+        The candidate files saved so far, as (path, FileRecord).
+        """
+        for path, size, inode, device, mtime, nlinks, ctime in self.db.execute_SQL(
+            "SELECT path, filesize, inode, device, mtime, nlinks, ctime FROM checkpoint_files WHERE run_id = ?;",
+            self.run_id):
+            yield path, FileRecord(path, size, inode, device, mtime, nlinks, ctime)
+
+
+    def hashed_sizes(self) -> set:
+        return {row[0] for row in self.db.execute_SQL(
+            "SELECT filesize FROM checkpoint_sizes WHERE run_id = ?;", self.run_id)}
+
+
+    def lister(self, inner:Callable) -> Callable:
+        """
+        Wrap a lister for walker.scan_tree so that a directory is
+        counted as done once its files have all been consumed.
+        """
+        def listing(d:str) -> tuple:
+            files, subdirs = inner(d)
+            return self.track(d, files, subdirs), subdirs
+        return listing
+
+
+    def track(self, d:str, files:Iterable, subdirs:list) -> Iterator[tuple]:
+        """
+        Consumed in the main thread. The files kept from d are not
+        saved until all of d has been seen; a save in the middle of a
+        directory would otherwise keep some of its files twice when
+        it is listed again.
+        """
+        yield from files
+        self.kept.extend(self.current)
+        self.current = []
+        self.found.extend((self.run_id, s) for s in subdirs)
+        self.done.append((self.run_id, d))
+
+
+    def keep(self, path:str, st:object) -> None:
+        """
+        Note a candidate file, to be saved with the next checkpoint.
+        """
+        self.current.append((self.run_id, path, st.st_size, st.st_ino, st.st_dev,
+            st.st_mtime, st.st_nlink, st.st_ctime))
+
+
+    def tick(self) -> None:
+        """
+        Save if it is time. Cheap enough to call for every file.
+        """
+        self.ticks += 1
+        if self.ticks % TICKS: return
+        if time.perf_counter() - self.last >= self.interval: self.save()
+
+
+    def save(self) -> None:
+        """
+        Write everything noted since the last save, in one transaction.
+        """
+        start = time.perf_counter()
+        cursor = self.db.cursor
+        if self.found: cursor.executemany(found_dir_statement, self.found)
+        if self.done: cursor.executemany(done_dir_statement, self.done)
+        if self.kept: cursor.executemany(keep_file_statement, self.kept)
+        if self.sizes: cursor.executemany(done_size_statement, self.sizes)
+        cursor.execute("UPDATE checkpoint_runs SET phase = ? WHERE run_id = ?;",
+            (self.phase, self.run_id))
+        self.db.commit()
+        self.found, self.done, self.kept, self.sizes = [], [], [], []
+
+        self.last = time.perf_counter()
+        cost = self.last - start
+        self.cost += cost
+        self.saves += 1
+        self.interval = max(self.interval, cost / self.max_overhead)
+
+
+    def begin_hashing(self) -> None:
+        """
+        The walk is complete.
+        """
+        self.phase = 'hash'
+        self.save()
+
+
+    def forget_unfinished(self) -> None:
+        """
+        Remove the rows written for sizes that were not finished when
+        the run was interrupted.
+        """
+        self.db.execute_SQL(textwrap.dedent(f"""
+            DELETE FROM {self.table_name} WHERE bucket NOT IN
+            (SELECT filesize FROM checkpoint_sizes WHERE run_id = ?);
+            """).strip(), self.run_id)
+        self.db.commit()
+
+
+    def hashed(self, sizes:Iterable[int], writer:object) -> None:
+        """
+        A batch of size groups is finished. If it is time to save, the
+        writer's rows are committed first.
+        """
+        self.sizes.extend((self.run_id, size) for size in sizes)
+        if time.perf_counter() - self.last >= self.interval:
+            writer.flush()
+            self.save()
+
+
+    def finish(self) -> None:
+        """
+        The run is complete, so there is nothing to resume.
+        """
+        self.discard(self.run_id)
+
+
+    @property
+    def overhead(self) -> float:
+        """
+        The fraction of the elapsed time spent saving.
+        """
+        elapsed = time.perf_counter() - self.started
+        return self.cost / elapsed if elapsed else 0.0
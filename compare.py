@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Compare a small group of same-sized files by reading them together,
+block by block, rather than hashing each one to the end. As soon as
+the contents diverge the group is split, and a file that has become
+unique is not read any further. Two files that differ at byte 4096
+cost one block apiece instead of two full reads.
+
+While the survivors are read, their common content is hashed once
+per block, so the files that turn out to be duplicates still have
+the same full_hash that FileClass.fullfingerprint would have given
+them.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import collections
+import contextlib
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import fileclass
+from   fileclass import FileClass, hashfoo
+import iohints
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+###
+# Groups with at most this many members are compared in lockstep;
+# larger groups are hashed.
+###
+DEFAULT_LOCKSTEP = 4
+
+
+def lockstep(files:list, block_size:int=FileClass.HASHBLOCK) -> tuple:
+    """
+    Partition files by content.
+
+    files -- FileClass objects, presumably all the same size.
+    block_size -- how much of each file is read at a time.
+
+    returns -- ([[FileClass, ... ], ... ], bytes_read) where each list
+        holds two or more files with identical contents. Unreadable
+        files are left out, as are files that match no other.
+    """
+    ###
+    # If the hash cache already knows every answer, there is nothing
+    # to read.
+    ###
+    if all(f.full_hash for f in files):
+        parts = collections.defaultdict(list)
+        for f in files: parts[f.full_hash].append(f)
+        return [p for p in parts.values() if len(p) > 1], 0
+
+    bytes_read = 0
+    finished = []
+    with contextlib.ExitStack() as stack:
+        ###
+        # FileClass compares equal by inode, so the open files are
+        # kept by position rather than in a dict keyed by FileClass.
+        ###
+        handles = {}
+        for i, f in enumerate(files):
+            try:
+                handle = stack.enter_context(open(f.name, 'rb'))
+                stack.enter_context(iohints.advised(handle))
+                handles[i] = handle
+            except OSError:
+                continue
+
+        groups = [(list(handles), hashfoo())]
+        while groups:
+            next_groups = []
+            for members, h in groups:
+                blocks = collections.defaultdict(list)
+                for i in members:
+                    try:
+                        block = handles[i].read(block_size)
+                    except OSError:
+                        continue
+                    bytes_read += len(block)
+                    blocks[block].append(i)
+
+                split = len(blocks) > 1
+                for block, same in blocks.items():
+                    if len(same) < 2: continue
+                    h_same = h.copy() if split else h
+                    if not block:
+                        finished.append((same, h_same))
+                        continue
+                    h_same.update(block)
+                    next_groups.append((same, h_same))
+
+            groups = next_groups
+
+    parts = []
+    for same, h in finished:
+        digest = h.hexdigest()
+        part = [files[i] for i in same]
+        for f in part:
+            f.full_hash = digest
+            if fileclass.hash_cache is not None: fileclass.hash_cache.remember(f)
+        parts.append(part)
+
+    return parts, bytes_read
+
+
+@trap
+def compare_main(myargs:argparse.Namespace) -> int:
+    """
+    Compare the bytes read by lockstep comparison with the bytes read
+    by hashing every file in full, for the files named on the command
+    line.
+    """
+    files = [FileClass(name) for name in myargs.files]
+    files = [f for f in files if f.usable]
+    by_size = collections.defaultdict(list)
+    for f in files: by_size[int(f)].append(f)
+
+    compared = hashed = 0
+    for size, group in by_size.items():
+        if len(group) < 2: continue
+        parts, n = lockstep(group, myargs.block_size)
+        compared += n
+        hashed += size * len(group)
+        for p in parts:
+            print(f"{size} {p[0].full_hash} " + " ".join(repr(f) for f in p))
+
+    print(f"lockstep read {compared} bytes; hashing would have read {hashed}.")
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="compare",
+        description="Compare files in lockstep, and report the bytes saved over hashing.")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--block-size', type=int, default=FileClass.HASHBLOCK,
+        help=f"Bytes read from each file at a time. Default is {FileClass.HASHBLOCK}")
+
+    myargs = parser.parse_args()
+    sys.exit(compare_main(myargs))
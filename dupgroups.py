@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Materialized groups, so that the questions asked of a large database
+are answered from small tables and indices rather than by grouping
+all of metadata again.
+
+    size_groups -- every size shared by two or more files, and how
+                   many. Refreshed after the files are loaded.
+    dup_groups  -- every set of two or more files with the same size
+                   and hash, with its member count and wasted bytes.
+                   Hard links to one inode are all members, but they
+                   take no extra space, so only the distinct inodes
+                   count toward the waste. Refreshed for just the
+                   sizes that were hashed, as calchashes writes each
+                   range of buckets.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import textwrap
+
+###
+# From hpclib
+###
+import sqlitedb
+
+###
+# imports and objects that are a part of this project
+###
+import hash
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+###
+# SQLite's default limit on host parameters is 999.
+###
+CHUNK = 900
+
+schema_statements = (
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS size_groups (
+        filesize INTEGER PRIMARY KEY,
+        members INTEGER
+        );
+    """).strip(),
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS dup_groups (
+        group_id INTEGER PRIMARY KEY,
+        filesize INTEGER,
+        hash TEXT,
+        members INTEGER,
+        wasted INTEGER,
+        UNIQUE (filesize, hash)
+        );
+    """).strip(),
+    "CREATE INDEX IF NOT EXISTS dup_size_idx ON dup_groups(filesize DESC, group_id);"
+    )
+
+###
+# Indices on the undeux.sql tables, created only where the table exists.
+###
+index_statements = {
+    'metadata' : (
+        "CREATE INDEX IF NOT EXISTS size_cover_idx ON metadata(filesize, deleted);",
+        "CREATE INDEX IF NOT EXISTS bucket_cover_idx ON metadata(bucket, deleted, filesize);"
+        ),
+    'hashes' : (
+        "CREATE INDEX IF NOT EXISTS hash_cover_idx ON hashes(file_id, hash);",
+        )
+    }
+
+refresh_sizes_statements = (
+    "DELETE FROM size_groups;",
+    textwrap.dedent("""
+    INSERT INTO size_groups (filesize, members)
+        SELECT filesize, COUNT(*) FROM metadata
+        WHERE NOT deleted AND filesize > 0
+        GROUP BY filesize HAVING COUNT(*) > 1;
+    """).strip()
+    )
+
+group_rows = lambda where : textwrap.dedent(f"""
+    INSERT INTO dup_groups (filesize, hash, members, wasted)
+        SELECT m.filesize, h.hash, COUNT(*),
+            m.filesize * (COUNT(DISTINCT COALESCE(m.device, '') || ':' || m.inode) - 1)
+        FROM metadata AS m JOIN hashes AS h ON h.file_id = m.rowid
+        WHERE NOT m.deleted AND h.hash != '{hash.ZERO_HASH}' {where}
+        GROUP BY m.filesize, h.hash HAVING COUNT(*) > 1;
+    """).strip()
+
+in_sizes = lambda n : f"filesize IN ({','.join('?'*n)})"
+
+
+def prepare(db:sqlitedb.SQLiteDB) -> None:
+    """
+    Create the tables and indices, if they are not there. The indices
+    on metadata and hashes are skipped if those tables are absent, as
+    they are in a database that has only been loaded.
+    """
+    for statement in schema_statements:
+        db.execute_SQL(statement)
+
+    tables = {row[0] for row in db.execute_SQL("SELECT name FROM sqlite_master WHERE type = 'table';")}
+    for table, statements in index_statements.items():
+        if table not in tables: continue
+        for statement in statements:
+            db.execute_SQL(statement)
+
+
+def refresh_sizes(db:sqlitedb.SQLiteDB) -> int:
+    """
+    Rebuild size_groups from metadata.
+
+    returns -- the number of sizes shared by more than one file.
+    """
+    prepare(db)
+    for statement in refresh_sizes_statements:
+        db.execute_SQL(statement)
+    db.commit()
+    return db.execute_SQL("SELECT COUNT(*) FROM size_groups;")[0][0]
+
+
+def refresh_groups(db:sqlitedb.SQLiteDB, sizes:Iterable[int]=None) -> None:
+    """
+    Rebuild the rows of dup_groups for the given sizes, or for every
+    size if sizes is None. Each size is found through the index on
+    metadata(filesize), so the cost follows the number of files of
+    those sizes, not the size of the table.
+    """
+    if sizes is None:
+        db.execute_SQL("DELETE FROM dup_groups;")
+        db.execute_SQL(group_rows(""))
+        db.commit()
+        return
+
+    sizes = list(sizes)
+    for i in range(0, len(sizes), CHUNK):
+        chunk = sizes[i:i+CHUNK]
+        db.execute_SQL(f"DELETE FROM dup_groups WHERE {in_sizes(len(chunk))};", *chunk)
+        db.execute_SQL(group_rows(f"AND m.{in_sizes(len(chunk))}"), *chunk)
+    db.commit()
+
+
+def totals(db:sqlitedb.SQLiteDB) -> tuple:
+    """
+    returns -- (groups, files in them, wasted bytes)
+    """
+    return tuple(db.execute_SQL(
+        "SELECT COUNT(*), COALESCE(SUM(members), 0), COALESCE(SUM(wasted), 0) FROM dup_groups;")[0])
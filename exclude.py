@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+The -x/--exclude fragments. A directory whose full path contains any
+of the fragments is dropped from the walk before it is listed, so
+nothing beneath it costs a system call.
+
+The fragments are compiled once into an Aho-Corasick automaton, and
+each path is matched against all of them in a single pass over its
+characters, however many fragments there are.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import collections
+import threading
+
+###
+# From hpclib
+###
+
+###
+# imports and objects that are a part of this project
+###
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class Excluder:
+    """
+    Match paths against a set of fragments, and count what is pruned.
+    The walker's threads share one Excluder.
+
+    ex = Excluder(['/scratch/tmp', 'node_modules'])
+    if ex.excludes(path): ...
+    """
+
+    def __init__(self, fragments:Iterable[str]=()) -> None:
+        self.fragments = sorted({f for f in fragments if f})
+        self.pruned_dirs = 0
+        self.pruned_entries = 0
+        self.lock = threading.Lock()
+
+        ###
+        # State 0 is the root. goto[s] maps a character to the next
+        # state, fail[s] is the state for the longest proper suffix of
+        # s that is also a prefix of some fragment, and final[s] is
+        # True if some fragment ends at s.
+        ###
+        self.goto = [{}]
+        self.fail = [0]
+        self.final = [False]
+        for fragment in self.fragments:
+            s = 0
+            for c in fragment:
+                if (t := self.goto[s].get(c)) is None:
+                    t = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.final.append(False)
+                    self.goto[s][c] = t
+                s = t
+            self.final[s] = True
+
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for c, t in self.goto[s].items():
+                queue.append(t)
+                f = self.fail[s]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[t] = self.goto[f].get(c, 0)
+                self.final[t] = self.final[t] or self.final[self.fail[t]]
+
+
+    def __bool__(self) -> bool:
+        return bool(self.fragments)
+
+
+    def excludes(self, path:str) -> bool:
+        """
+        True if any fragment occurs in path.
+        """
+        goto, fail, final = self.goto, self.fail, self.final
+        s = 0
+        for c in path:
+            while s and c not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(c, 0)
+            if final[s]: return True
+        return False
+
+
+    def prune(self, subdirs:list, hidden:int=0) -> list:
+        """
+        Drop the excluded directories from one listing.
+
+        subdirs -- the directories found in the listing.
+        hidden -- the number of hidden entries the listing skipped.
+
+        returns -- the directories to visit.
+        """
+        kept = [d for d in subdirs if not self.excludes(d)] if self else subdirs
+        with self.lock:
+            self.pruned_dirs += len(subdirs) - len(kept)
+            self.pruned_entries += hidden
+        return kept
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+An external-sort replacement for candidates.CandidateIndex, for
+filesystems whose candidate list will not fit in memory. Files are
+buffered until the memory budget is reached, then sorted by size and
+written to a temporary run on disc. Grouping merges the runs and keeps
+only the sizes that appear more than once.
+
+A run is closed as soon as it is written, and opened again only while
+it is being merged, so the number of open files depends on the fan-in
+of the merge rather than on the number of runs.
+
+The interface matches CandidateIndex, so undeux_main does not care
+which one it has, and the groups come out in the same order with the
+same members.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import heapq
+import itertools
+import operator
+import resource
+import struct
+import tempfile
+
+###
+# From hpclib
+###
+
+###
+# imports and objects that are a part of this project
+###
+from   fileclass import FileRecord
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+###
+# On disc, each file is a fixed header followed by its name.
+#   size, inode, device, mtime, nlinks, ctime, length of the name
+###
+RECORD = struct.Struct('<qQQdIdI')
+
+###
+# The approximate cost in memory of one buffered file, not
+# counting its name: a tuple, four ints, two floats, and the
+# list slot that holds the tuple.
+###
+OVERHEAD = 200
+
+###
+# The largest number of runs merged at once. Above this, the
+# runs are merged in passes so we never hold too many open
+# files or too many read buffers.
+###
+MAX_FANIN = 128
+IO_BUFFER = 1 << 16
+
+by_descending_size = lambda r : -r[0]
+
+
+def fan_in() -> int:
+    """
+    The number of runs to merge at once: MAX_FANIN, or fewer when
+    the limit on open files is low, leaving most of the descriptors
+    to the walk and the database.
+    """
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY: return MAX_FANIN
+    return max(2, min(MAX_FANIN, soft // 4))
+
+
+def write_run(records:Iterable[tuple], spill_dir:str=None) -> str:
+    """
+    Write records to a new temporary file, and close it.
+
+    returns -- the file's name.
+    """
+    fd, name = tempfile.mkstemp(prefix='undeux', suffix='.run', dir=spill_dir)
+    with open(fd, 'wb', buffering=IO_BUFFER) as f:
+        for size, ino, dev, mtime, nlinks, ctime, path in records:
+            f.write(RECORD.pack(size, ino, dev, mtime, nlinks, ctime, len(path)))
+            f.write(path)
+    return name
+
+
+def read_run(name:str) -> Iterator[tuple]:
+    """
+    The inverse of write_run. The file is open only while the
+    generator is running.
+    """
+    with open(name, 'rb', buffering=IO_BUFFER) as f:
+        while (header := f.read(RECORD.size)):
+            *facts, n = RECORD.unpack(header)
+            yield (*facts, f.read(n))
+
+
+def remove_runs(names:Iterable[str]) -> None:
+    for name in names:
+        try:
+            os.unlink(name)
+        except FileNotFoundError:
+            pass
+
+
+class SpillIndex:
+    """
+    Files grouped by size, with the grouping done on disc.
+    """
+
+    def __init__(self, budget:int, spill_dir:str=None) -> None:
+        """
+        budget -- the number of bytes of buffered files to hold
+            before writing a sorted run.
+        spill_dir -- where to put the runs. Defaults to $TMPDIR.
+        """
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.buffer = []
+        self.buffered = 0
+        self.runs = []
+        self.merged = None
+        self.count = 0
+        self.distinct_sizes = 0
+        self.group_count = 0
+        self.biggest = (0, 0)
+
+
+    def __len__(self) -> int:
+        return self.count
+
+
+    def add(self, path:str, stats:os.stat_result) -> None:
+        """
+        Add one file.
+
+        path -- the file's complete name.
+        stats -- an os.stat_result, or anything with the same st_ fields.
+        """
+        name = os.fsencode(path)
+        self.buffer.append((stats.st_size, stats.st_ino, stats.st_dev,
+            stats.st_mtime, stats.st_nlink, stats.st_ctime, name))
+        self.count += 1
+        self.buffered += OVERHEAD + len(name)
+        if self.buffered >= self.budget: self.spill()
+
+
+    def spill(self) -> None:
+        """
+        Sort what is in memory and write it out as a run. The sort is
+        stable, so files of the same size keep the order in which they
+        were added.
+        """
+        if not self.buffer: return
+        self.buffer.sort(key=by_descending_size)
+        self.runs.append(write_run(self.buffer, self.spill_dir))
+        self.buffer = []
+        self.buffered = 0
+
+
+    def merge_runs(self, runs:list) -> Iterator[tuple]:
+        """
+        heapq.merge breaks ties in favor of the earlier run, so the
+        result is the same as a stable sort of everything added.
+        """
+        return heapq.merge(*(read_run(r) for r in runs), key=by_descending_size)
+
+
+    def drop_singletons(self) -> int:
+        """
+        Merge the runs, writing only the files whose sizes are shared
+        with at least one other file.
+
+        returns -- the number of files remaining.
+        """
+        self.spill()
+        width = fan_in()
+        while len(self.runs) > width:
+            ###
+            # Merge consecutive batches, keeping the batches in order,
+            # so that ties are still resolved in order of arrival.
+            ###
+            merged = []
+            for i in range(0, len(self.runs), width):
+                batch = self.runs[i:i+width]
+                merged.append(write_run(self.merge_runs(batch), self.spill_dir))
+                remove_runs(batch)
+            self.runs = merged
+
+        kept = self.distinct_sizes = self.group_count = 0
+        self.biggest = (0, 0)
+
+        def shared() -> Iterator[tuple]:
+            nonlocal kept
+            for size, members in itertools.groupby(self.merge_runs(self.runs), key=operator.itemgetter(0)):
+                self.distinct_sizes += 1
+                ###
+                # Hold back the first member until we know it has company,
+                # so that memory stays constant however large the group.
+                ###
+                first = next(members)
+                n = 0
+                for r in members:
+                    if not n:
+                        yield first
+                        n = 1
+                    yield r
+                    n += 1
+
+                if n:
+                    kept += n
+                    self.group_count += 1
+                    if n > self.biggest[1]: self.biggest = (size, n)
+
+        self.merged = write_run(shared(), self.spill_dir)
+        remove_runs(self.runs)
+        self.runs = []
+        self.count = kept
+        return kept
+
+
+    def groups(self) -> Iterator[tuple]:
+        """
+        A generator of (size, [FileRecord, ... ]) for each size shared
+        by more than one file, largest first.
+        """
+        if self.merged is None: self.drop_singletons()
+        for size, members in itertools.groupby(read_run(self.merged), key=operator.itemgetter(0)):
+            yield size, [FileRecord(os.fsdecode(r[6]), *r[:6]) for r in members]
+
+
+    def largest_group(self) -> tuple:
+        """
+        returns -- (size, member_count) for the most populous size.
+        """
+        return self.biggest
+
+
+    def close(self) -> None:
+        remove_runs(self.runs)
+        self.runs = []
+        if self.merged is not None: remove_runs((self.merged,))
+        self.merged = None
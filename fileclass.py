@@ -19,12 +19,15 @@ if sys.version_info < min_py:
 # Other standard distro imports
 ###
 import argparse
+import collections
 from   collections.abc import *
 import contextlib
 import getpass
 import io
 import logging
+import mmap
 import stat
+import time
 import tomllib
 
 ###
@@ -43,6 +46,7 @@ hashfoo=xxhash.xxh128
 ###
 # imports and objects that were written for this project.
 ###
+import iohints
 
 ###
 # Global objects
@@ -50,6 +54,13 @@ hashfoo=xxhash.xxh128
 mynetid = getpass.getuser()
 logger = None
 
+###
+# If the caller sets this to a hashcache.HashCache, the hashing
+# methods consult it before reading a file, and report the
+# hashes they calculate to it.
+###
+hash_cache = None
+
 ###
 # Credits
 ###
@@ -74,6 +85,16 @@ os_FILETYPES = {
 }
 
 
+###
+# A compact stand-in for os.stat_result that carries only the facts
+# the later stages need. Because the field names match those of
+# os.stat_result, a FileRecord can be handed to FileClass in place
+# of a stat, and the file's metadata need not be read again.
+###
+FileRecord = collections.namedtuple('FileRecord',
+    'name st_size st_ino st_dev st_mtime st_nlink st_ctime')
+
+
 class FileClass: pass
 class FileClass:
     """
@@ -101,6 +122,17 @@ class FileClass:
     """
     BUFSIZE = io.DEFAULT_BUFFER_SIZE
     HASHBLOCK = BUFSIZE << 8
+    SAMPLEBLOCK = BUFSIZE << 4
+    SAMPLES = 8
+
+    ###
+    # Files of at least MMAP_THRESHOLD bytes are hashed from a memory
+    # map rather than read through a buffer. None turns this off. The
+    # map is made MMAP_WINDOW bytes at a time, to bound the address
+    # space used by each hashing thread.
+    ###
+    MMAP_THRESHOLD = None
+    MMAP_WINDOW = 1 << 28
 
     __slots__ = {
         'name' : "the file's complete name",
@@ -108,23 +140,37 @@ class FileClass:
         'usable' : "whether this file meets the criteria",
         'unique' : "has exactly one link.",
         'hash' : "the integer representation of the file's partial hash.",
+        'sample_hash' : "the hash of blocks sampled from the file's interior.",
         'full_hash' : "the integer representation of the file's full hash."
         }
 
-    __values__ = ("", None, None, False, None, None)
+    __values__ = ("", None, None, False, None, None, None)
     __defaults__ = dict(zip(__slots__, __values__))
 
 
     def __init__(self, name:str, stat:os.stat_result=None) -> None:
+        """
+        name -- the file's complete name.
+        stat -- optionally, the file's metadata if the caller already
+            has them: an os.stat_result, a FileRecord, or an os.DirEntry.
+            If absent, the file is stat-ed here.
+        """
         for k, v in FileClass.__defaults__.items():
             setattr(self, k, v)
 
         self.name = name
-        if stat is None:
+        if isinstance(stat, os.DirEntry):
+            try:
+                stat = stat.stat(follow_symlinks=False)
+            except OSError:
+                stat = False
+        elif stat is None:
             try:
-                self.inodedata=os.stat(name)
+                stat = os.stat(name)
             except:
-                self.inodedata = None
+                stat = False
+
+        self.inodedata = stat if stat else None
         self.usable = self.inodedata is not None
         if not self.usable: return
         self.unique = self.inodedata.st_nlink == 1
@@ -157,9 +203,10 @@ class FileClass:
     def __eq__(self, other:FileClass) -> bool:
         if not isinstance(other, FileClass): return NotImplemented
 
-        # Two files with the same inode are the same file. This
-        # function effectively works like "is".
-        return self.inodedata.st_ino == other.inodedata.st_ino
+        # Two files with the same inode on the same device are the
+        # same file. This function effectively works like "is".
+        return (self.inodedata.st_ino == other.inodedata.st_ino and
+            self.inodedata.st_dev == other.inodedata.st_dev)
 
 
     def __ne__(self, other:FileClass) -> bool:
@@ -173,38 +220,101 @@ class FileClass:
         file is small.
         """
         if self.hash: return self.hash
-        f = open(self.name, 'rb')
-        if self.inodedata.st_size > FileClass.HASHBLOCK:
-            h = hashfoo()
-            h.update(f.read(FileClass.HASHBLOCK))
-            f.seek(-FileClass.HASHBLOCK, os.SEEK_END)
-            h.update(f.read())
-            self.hash = h.hexdigest()
+        if hash_cache is not None and hash_cache.recall(self) and self.hash: return self.hash
+
+        with open(self.name, 'rb') as f, iohints.advised(f):
+            if self.inodedata.st_size > FileClass.HASHBLOCK:
+                h = hashfoo()
+                h.update(f.read(FileClass.HASHBLOCK))
+                f.seek(-FileClass.HASHBLOCK, os.SEEK_END)
+                h.update(f.read())
+                self.hash = h.hexdigest()
 
-        else:
-            self.full_hash = self.hash = hashfoo(f.read()).hexdigest()
+            else:
+                self.full_hash = self.hash = hashfoo(f.read()).hexdigest()
 
+        if hash_cache is not None: hash_cache.remember(self)
         return self.hash
 
 
+    def sampled_fingerprint(self, samples:int=SAMPLES) -> str:
+        """
+        Hash samples blocks of SAMPLEBLOCK bytes spaced evenly through
+        the part of the file that fingerprint() does not read. Files
+        that agree at the ends often differ in the middle, and this is
+        a cheap way to find out before reading the whole thing.
+        """
+        if self.sample_hash: return self.sample_hash
+
+        first = FileClass.HASHBLOCK
+        last = max(first, self.inodedata.st_size - FileClass.HASHBLOCK - FileClass.SAMPLEBLOCK)
+        h = hashfoo()
+        with open(self.name, 'rb') as f, iohints.advised(f):
+            fd = f.fileno()
+            for i in range(1, samples+1):
+                h.update(os.pread(fd, FileClass.SAMPLEBLOCK, first + (last - first) * i // (samples+1)))
+
+        self.sample_hash = h.hexdigest()
+        return self.sample_hash
+
 
     def fullfingerprint(self) -> str:
         """
         Hash the whole file.
         """
         if self.full_hash: return self.full_hash
+        if hash_cache is not None and hash_cache.recall(self) and self.full_hash: return self.full_hash
 
         try:
-            f = open(self.name, 'rb')
+            if (FileClass.MMAP_THRESHOLD is not None and
+                self.inodedata.st_size >= FileClass.MMAP_THRESHOLD):
+                self.full_hash = self.mapped_hash()
+            else:
+                self.full_hash = self.buffered_hash()
+
+            if hash_cache is not None: hash_cache.remember(self)
+            return self.full_hash
+
+        except Exception as e:
+            return None
+
+
+    def buffered_hash(self) -> str:
+        """
+        Hash the whole file, reading HASHBLOCK bytes at a time.
+        """
+        with open(self.name, 'rb') as f, iohints.advised(f):
             h = hashfoo()
             while chunk := f.read(FileClass.HASHBLOCK):
                 h.update(chunk)
 
-            self.full_hash = h.hexdigest()
-            return self.full_hash
+        return h.hexdigest()
 
-        except Exception as e:
-            f.close()
+
+    def mapped_hash(self) -> str:
+        """
+        Hash the whole file directly from a memory map, one window at
+        a time, so that no bytes are copied into Python objects. The
+        kernel is told the access is sequential so that it reads ahead
+        aggressively.
+
+        The size is taken from fstat at the time the file is opened.
+        Truncating the file while it is mapped would be fatal to the
+        process, but that risk is no greater than for any other mmap.
+        """
+        h = hashfoo()
+        with open(self.name, 'rb') as f, iohints.advised(f):
+            fd = f.fileno()
+            size = os.fstat(fd).st_size
+            if iohints.available: iohints.advise(fd, os.POSIX_FADV_SEQUENTIAL)
+
+            for offset in range(0, size, FileClass.MMAP_WINDOW):
+                length = min(FileClass.MMAP_WINDOW, size - offset)
+                with mmap.mmap(fd, length, offset=offset, access=mmap.ACCESS_READ) as m:
+                    if hasattr(m, 'madvise'): m.madvise(mmap.MADV_SEQUENTIAL)
+                    h.update(m)
+
+        return h.hexdigest()
 
 
     @property
@@ -267,12 +377,42 @@ def parse_st_mode(mode:int) -> tuple:
     return (ftype, permissions, octal_str)
 
 
+def bench(names:Iterable[str], passes:int) -> list:
+    """
+    Time buffered_hash against mapped_hash on the same files, cold
+    and warm, so that a sensible MMAP_THRESHOLD can be chosen for
+    each filesystem.
+
+    returns -- a list of (name, size, method, cache, MB/s).
+    """
+    results = []
+    for name in names:
+        f = FileClass(name)
+        if not f.usable: continue
+        for method in (FileClass.buffered_hash, FileClass.mapped_hash):
+            for cache in ('cold', 'warm'):
+                best = float('inf')
+                for _ in range(passes):
+                    if cache == 'cold': iohints.evict(name)
+                    start = time.perf_counter()
+                    method(f)
+                    best = min(best, time.perf_counter() - start)
+                mbps = int(f) / best / (1 << 20) if best else 0.0
+                results.append((name, int(f), method.__name__, cache, mbps))
+    return results
+
+
 @trap
 def fileclass_main(myargs:argparse.Namespace) -> int:
     """
     Simplified test function for the functions above.
     """
 
+    if myargs.bench:
+        for name, size, method, cache, mbps in bench(filter(None, (myargs.f, myargs.g)), myargs.bench):
+            print(f"{name} {size} {method:>13} {cache} {mbps:10.1f} MB/s")
+        return os.EX_OK
+
     f = FileClass(myargs.f)
     f.fingerprint()
     f.fullfingerprint()
@@ -304,6 +444,9 @@ if __name__ == '__main__':
     parser.add_argument('-f', type=str, required=True)
     parser.add_argument('-g', type=str, default="")
 
+    parser.add_argument('--bench', type=int, default=0,
+        help="Compare buffered and memory mapped hashing of -f (and -g), taking the best of this many passes.")
+
     parser.add_argument('--loglevel', type=int,
         choices=range(logging.FATAL, logging.NOTSET, -10),
         default=logging.DEBUG,
@@ -16,11 +16,11 @@ if sys.version_info < min_py:
 ###
 # Other standard distro imports
 ###
+import itertools
 
 ###
 # Installed libraries.
 ###
-import xxhash
 
 ###
 # From hpclib
@@ -32,6 +32,7 @@ from   urdecorators import trap
 ###
 # imports and objects that are a part of this project
 ###
+import walker
 
 
 ###
@@ -51,60 +52,45 @@ __status__ = 'in progress'
 __license__ = 'MIT'
 
 @trap
-def files_and_stats(d:str) -> tuple:
+def files_and_stats(d:str, workers:int=walker.DEFAULT_WALKERS,
+    exclude:object=None) -> tuple:
     """
     return the file name and info about it.
 
     d -- The name of a directory.
+    workers -- The number of directories listed concurrently.
+    exclude -- An exclude.Excluder, or None.
     """
-    for f in fileutils.all_files_in(d):
+    for f, stats in walker.scan_tree(fileutils.expandall(d), workers, exclude=exclude):
         # If we cannot read the file's info, we cannot
-        # do anything about it. Just skip it.
-        try:
-            stats = os.stat(f)
-            # Ignore zero length files.
-            if not stats.st_size: continue
-        except Exception as e:
-            continue
-
-        # For parallel processing, let's create some buckets to which the
-        # files will be assigned. Buckets number [ 0 .. 99 ] seem about
-        # right for grinding out hashes.
-        bucket = xxhash.xxh3_128_intdigest(f) % 100
+        # do anything about it. Just skip it. Also, ignore
+        # zero length files.
+        if stats is None or not stats.st_size: continue
+
+        # The bucket is assigned after the scan, by partition.assign_buckets,
+        # when the bytes to be hashed are known.
+        bucket = None
         d_part, f_part = os.path.split(f)
-        yield f_part, d_part, stats.st_ino, stats.st_nlink, stats.st_size, stats.st_mtime, stats.st_atime, bucket
+        yield (f_part, d_part, stats.st_ino, stats.st_nlink, stats.st_size, stats.st_mtime,
+            stats.st_atime, bucket, stats.st_dev, stats.st_ctime)
 
 
 @trap
-def block_of_files(d:str, block_size:int) -> tuple:
+def block_of_files(d:str, block_size:int,
+    workers:int=walker.DEFAULT_WALKERS,
+    exclude:object=None) -> list:
     """
     Collect info about the next block_size number of files.
 
     d           --- The name of a directory.
     block_size  --- How many files we want at a time.
-    """
+    workers     --- The number of directories listed concurrently.
+    exclude     --- An exclude.Excluder, or None.
 
-    # Clearing the list and appending elements is not an
-    # efficient operation. Build the list the desired 
-    # size and rotate through it. 
-    data = [None]*block_size
-    # Keep in mind there are millions of files and the
-    # block_size is not going to change, so just do
-    # the subtraction once.
-    max_index = block_size-1
-
-    # Use enumerate to tell us which element of data will
-    # receive the info. 
-    i = 0
-    for i, row in enumerate(files_and_stats(d)):
-        data[i%block_size] = row
-        # When the block is "full", return it.
-        if i % block_size == max_index:
-            yield data
-
-    # We are finished. There is a 1:block_size chance that
-    # we finished with the block filled.
-    if not i or i % block_size == max_index:
-        raise StopIteration
-
-    yield data[:(i%block_size)+1]
+    Each block is a new list, so a consumer may keep it (or hand it
+    to another thread) while the next one is being filled. The last
+    block is short, and there is no empty block at the end.
+    """
+    rows = files_and_stats(d, workers, exclude)
+    while (block := list(itertools.islice(rows, block_size))):
+        yield block
@@ -41,6 +41,7 @@ from   urdecorators import trap
 ###
 # imports and objects that are a part of this project
 ###
+import iohints
 
 ###
 # Credits
@@ -54,11 +55,37 @@ __email__ = ['gflanagin@richmond.edu']
 __status__ = 'in progress'
 __license__ = 'MIT'
 
+###
+# Parallel filesystems want large requests. This is the default size
+# of the buffer that each Hash object reads into.
+###
+DEFAULT_BLOCK_SIZE = 1 << 22
+
+ZERO_HASH = "0"*32
+
+
 class Hash:
+    """
+    A reusable file hasher. Each Hash owns one preallocated buffer,
+    and files are read into it with readinto(), so no bytes objects
+    are created no matter how large the file. A Hash is not thread
+    safe; give each thread its own.
+    """
+
+    def __init__(self, block_size:int=DEFAULT_BLOCK_SIZE):
+        """
+        block_size -- the number of bytes requested from the
+            filesystem with each read.
+        """
+        self.block_size = max(block_size, DEFAULT_BUFFER_SIZE)
+        self.buffer = bytearray(self.block_size)
+        self.view = memoryview(self.buffer)
 
-    def __init__(self):
+
+    @staticmethod
+    def new_hasher() -> object:
         global use_fast_hash
-        self.hasher = xxhash.xxh3_128() if use_fast_hash else hashlib.md5()
+        return xxhash.xxh3_128() if use_fast_hash else hashlib.md5()
 
 
     def hash_file(self, filename:str, how_much:int=0) -> str:
@@ -67,29 +94,42 @@ class Hash:
 
         filename -- the name of the file we want to hash.
         how_much -- defaults to 0, which will mean the entire file.
+            Otherwise, only the first how_much bytes are hashed.
         """
-
-        i = -1
+        hasher = Hash.new_hasher()
+        remaining = how_much if how_much > 0 else -1
         try:
-            with open(filename, 'rb') as f:
-
-                if not how_much:
-                    # Read it all.
-                    while (segment := f.read(DEFAULT_BUFFER_SIZE)):
-                        self.hasher.update(segment)
-                else:
-                    # Read some.
-                    while i - how_much:
-                        i, segment = enumerate(f.read(DEFAULT_BUFFER_SIZE))
-                        if segment:
-                            self.hasher.update(segment)
+            with open(filename, 'rb', buffering=0) as f, iohints.advised(f):
+                while remaining:
+                    view = self.view if remaining < 0 or remaining >= self.block_size else self.view[:remaining]
+                    if not (n := f.readinto(view)): break
+                    hasher.update(view[:n])
+                    if remaining > 0: remaining -= n
+
         except:
             # We were not able to open or read the file. No need to
             # be concerned with how this happened, so return a zero
             # hash string.
-            return "0"*32
+            return ZERO_HASH
 
         else:
-            return self.hasher.hexdigest()
+            return hasher.hexdigest()
 
 
+    def hash_files(self, filenames:Iterable[str], how_much:int=0) -> dict:
+        """
+        Hash each of the files, reusing the one buffer.
+
+        returns -- {filename : hexdigest}. Files that could not be
+            read have the ZERO_HASH.
+
+        If iohints are enabled, the kernel is asked to start reading
+        each file while the one before it is being hashed.
+        """
+        filenames = list(filenames)
+        ranges = ((0, how_much),)
+        digests = {}
+        for i, f in enumerate(filenames):
+            if i + 1 < len(filenames): iohints.prefetch(filenames[i+1], ranges)
+            digests[f] = self.hash_file(f, how_much)
+        return digests
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+A persistent cache of hashes, kept in the undeux database, so that
+a weekly rerun over the same trees does not reread the files that
+have not changed. An entry is keyed by (device, inode), and it is
+trusted only if the file's size, mtime, and ctime all match what
+was recorded when the hashes were calculated.
+
+The hashing threads never touch the database. The main thread
+primes the cache for a batch of files, the threads consult the
+primed entries through FileClass, and the main thread flushes the
+new hashes when the batch is finished.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import collections
+import textwrap
+import threading
+
+###
+# From hpclib
+###
+import sqlitedb
+
+###
+# imports and objects that are a part of this project
+###
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+###
+# Entries not seen in this many runs are evicted.
+###
+DEFAULT_KEEP_RUNS = 8
+
+###
+# SQLite's default limit on host parameters is 999.
+###
+CHUNK = 900
+
+cache_statements = (
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS hash_cache_runs (
+        run_id INTEGER PRIMARY KEY,
+        started DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """).strip(),
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS hash_cache (
+        device INTEGER,
+        inode INTEGER,
+        filesize INTEGER,
+        mtime REAL,
+        ctime REAL,
+        fingerprint TEXT,
+        fullhash TEXT,
+        last_run INTEGER,
+        PRIMARY KEY (device, inode)
+        ) WITHOUT ROWID;
+    """).strip(),
+    textwrap.dedent("""
+    CREATE INDEX IF NOT EXISTS hash_cache_run_idx ON hash_cache(last_run);
+    """).strip(),
+    textwrap.dedent("""
+    CREATE INDEX IF NOT EXISTS hash_cache_inode_idx ON hash_cache(inode);
+    """).strip()
+    )
+
+###
+# With the device given, the lookup is a search of the primary key.
+###
+lookup_statement = lambda n : textwrap.dedent(f"""
+    SELECT device, inode, filesize, mtime, ctime, fingerprint, fullhash
+    FROM hash_cache WHERE device = ? AND inode IN ({','.join('?'*n)});
+    """).strip()
+
+###
+# For callers that know only the inode, through hash_cache_inode_idx.
+###
+inode_lookup_statement = lambda n : textwrap.dedent(f"""
+    SELECT device, inode, filesize, mtime, ctime, fingerprint, fullhash
+    FROM hash_cache WHERE inode IN ({','.join('?'*n)});
+    """).strip()
+
+store_statement = textwrap.dedent("""
+    INSERT OR REPLACE INTO hash_cache
+        (device, inode, filesize, mtime, ctime, fingerprint, fullhash, last_run)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+    """).strip()
+
+touch_statement = textwrap.dedent("""
+    UPDATE hash_cache SET last_run = ? WHERE device = ? AND inode = ?;
+    """).strip()
+
+###
+# Store a full hash without losing a fingerprint that is still valid.
+###
+upsert_full_statement = textwrap.dedent("""
+    INSERT INTO hash_cache
+        (device, inode, filesize, mtime, ctime, fullhash, last_run)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (device, inode) DO UPDATE SET
+        fingerprint = CASE WHEN (filesize, mtime, ctime) =
+            (excluded.filesize, excluded.mtime, excluded.ctime)
+            THEN fingerprint ELSE NULL END,
+        filesize = excluded.filesize,
+        mtime = excluded.mtime,
+        ctime = excluded.ctime,
+        fullhash = excluded.fullhash,
+        last_run = excluded.last_run;
+    """).strip()
+
+evict_statement = textwrap.dedent("""
+    DELETE FROM hash_cache WHERE last_run <= ?;
+    """).strip()
+
+
+class HashCache:
+    """
+    The cache for one run of the program.
+    """
+
+    def __init__(self, db:sqlitedb.SQLiteDB, keep_runs:int=DEFAULT_KEEP_RUNS) -> None:
+        """
+        db -- the open database. The cache's tables are created if
+            they are not already there.
+        keep_runs -- entries not seen in this many runs are evicted
+            by evict().
+        """
+        self.db = db
+        self.keep_runs = keep_runs
+        self.primed = {}
+        self.pending = {}
+        self.touched = []
+        self.hits = self.misses = self.stores = 0
+        self.lock = threading.Lock()
+
+        for statement in cache_statements:
+            db.execute_SQL(statement)
+        db.execute_SQL("INSERT INTO hash_cache_runs DEFAULT VALUES;")
+        self.run_id = db.execute_SQL("SELECT MAX(run_id) FROM hash_cache_runs;")[0][0]
+
+
+    @staticmethod
+    def key(f:object) -> tuple:
+        return f.inodedata.st_dev, f.inodedata.st_ino
+
+
+    def prime(self, files:Iterable) -> None:
+        """
+        Look up a batch of FileClass objects, and hold the entries that
+        are still valid where the hashing threads can reach them.
+        """
+        files = [f for f in files if f.usable]
+        wanted = {self.key(f) : f for f in files}
+        by_device = collections.defaultdict(list)
+        for dev, ino in wanted: by_device[dev].append(ino)
+
+        for dev, inodes in by_device.items():
+            for i in range(0, len(inodes), CHUNK):
+                chunk = inodes[i:i+CHUNK]
+                for dev, ino, size, mtime, ctime, fp, full in self.db.execute_SQL(
+                    lookup_statement(len(chunk)), dev, *chunk):
+
+                    st = wanted[dev, ino].inodedata
+                    if (size, mtime, ctime) != (st.st_size, st.st_mtime, st.st_ctime): continue
+                    self.primed[dev, ino] = (fp, full)
+
+        with self.lock:
+            for k in wanted:
+                if k in self.primed:
+                    self.hits += 1
+                    self.touched.append((self.run_id, *k))
+                else:
+                    self.misses += 1
+
+
+    def recall(self, f:object) -> bool:
+        """
+        Called from FileClass. Fill in whatever hashes the cache knows
+        for f, and return True if it knew any.
+        """
+        if (entry := self.primed.get(self.key(f))) is None: return False
+        fp, full = entry
+        if fp and not f.hash: f.hash = fp
+        if full and not f.full_hash: f.full_hash = full
+        return bool(fp or full)
+
+
+    def remember(self, f:object) -> None:
+        """
+        Called from FileClass after it calculates a hash. The row is
+        written by the next flush(), with whatever hashes f has by then.
+        """
+        with self.lock:
+            self.pending[self.key(f)] = f
+
+
+    def flush(self) -> None:
+        """
+        Write the new hashes and mark the hits as seen in this run. Only
+        the main thread calls this.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            touched, self.touched = self.touched, []
+        self.primed = {}
+
+        rows = []
+        for (dev, ino), f in pending.items():
+            st = f.inodedata
+            rows.append((dev, ino, st.st_size, st.st_mtime, st.st_ctime,
+                f.hash, f.full_hash, self.run_id))
+
+        if touched:
+            self.db.cursor.executemany(touch_statement, touched)
+        if rows:
+            self.db.cursor.executemany(store_statement, rows)
+            self.stores += len(rows)
+        self.db.commit()
+
+
+    def candidates(self, inodes:Iterable[int]) -> dict:
+        """
+        For callers that know inode numbers but have not yet stat-ed
+        the files: every entry with a full hash for each inode, as
+        {inode : [(device, size, mtime, ctime, fullhash), ... ]}. The
+        caller decides which, if any, is still valid.
+        """
+        inodes = list(inodes)
+        found = {}
+        for i in range(0, len(inodes), CHUNK):
+            chunk = inodes[i:i+CHUNK]
+            for dev, ino, size, mtime, ctime, fp, full in self.db.execute_SQL(
+                inode_lookup_statement(len(chunk)), *chunk):
+                if full: found.setdefault(ino, []).append((dev, size, mtime, ctime, full))
+        return found
+
+
+    def store_full(self, rows:Iterable[tuple], seen:Iterable[tuple]=()) -> None:
+        """
+        The counterpart of candidates().
+
+        rows -- (device, inode, size, mtime, ctime, fullhash) for files
+            that were hashed.
+        seen -- (device, inode) of the entries that were used.
+        """
+        rows = [(*r, self.run_id) for r in rows]
+        seen = [(self.run_id, *k) for k in seen]
+        if rows:
+            self.db.cursor.executemany(upsert_full_statement, rows)
+            self.stores += len(rows)
+        if seen:
+            self.db.cursor.executemany(touch_statement, seen)
+        self.db.commit()
+
+
+    def evict(self) -> int:
+        """
+        Remove the entries that have not been seen in keep_runs runs.
+
+        returns -- the number of entries removed.
+        """
+        self.flush()
+        before = self.db.execute_SQL("SELECT COUNT(*) FROM hash_cache;")[0][0]
+        self.db.execute_SQL(evict_statement, self.run_id - self.keep_runs)
+        after = self.db.execute_SQL("SELECT COUNT(*) FROM hash_cache;")[0][0]
+        return before - after
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+The progressive hashing pipeline. Files that have the same size are
+compared in stages of increasing cost, and each stage only considers
+the files that still collide after the one before it:
+
+    1. the first and last FileClass.HASHBLOCK bytes (fingerprint)
+    2. a few blocks sampled from the interior (sampled_fingerprint)
+    3. the whole file (fullfingerprint)
+
+Most groups of same-sized files come apart in the first stage, so
+only the true duplicates are ever read from end to end.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import collections
+import contextlib
+import time
+
+###
+# From hpclib
+###
+
+###
+# imports and objects that are a part of this project
+###
+import compare
+import fileclass
+from   fileclass import FileClass
+import iohints
+import readorder
+import scheduler
+
+###
+# The number of files whose hashing is scheduled together.
+###
+DEFAULT_BATCH = 4096
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def partition(files:list, stage:Callable) -> list:
+    """
+    Split files into lists that agree on stage(f), and return only
+    the lists with more than one member. Files that cannot be read
+    are dropped; they cannot be shown to be duplicates.
+    """
+    parts = collections.defaultdict(list)
+    for f in files:
+        try:
+            key = stage(f)
+        except Exception as e:
+            key = None
+        if key is not None: parts[key].append(f)
+
+    return [p for p in parts.values() if len(p) > 1]
+
+
+def bytes_read(size:int, stage:str, samples:int) -> int:
+    """
+    How much of a file of this size each stage reads.
+    """
+    if stage == 'fingerprint': return min(size, FileClass.HASHBLOCK << 1)
+    if stage == 'sampled': return min(size, samples * FileClass.SAMPLEBLOCK)
+    # Small files were hashed entirely by fingerprint().
+    return 0 if size <= FileClass.HASHBLOCK else size
+
+
+def needs_sampling(size:int, samples:int) -> bool:
+    """
+    Sampling only pays when the unread interior is large compared to
+    the samples; otherwise we may as well hash the whole thing.
+    """
+    return size - (FileClass.HASHBLOCK << 1) > (samples * FileClass.SAMPLEBLOCK) << 2
+
+
+def stages_for(size:int, samples:int) -> list:
+    """
+    The (name, function, attribute) triples that apply to files of
+    this size. The attribute is where FileClass keeps the result.
+    """
+    stages = [('fingerprint', FileClass.fingerprint, 'hash')]
+    if needs_sampling(size, samples):
+        stages.append(('sampled', lambda f : f.sampled_fingerprint(samples), 'sample_hash'))
+    stages.append(('full', FileClass.fullfingerprint, 'full_hash'))
+    return stages
+
+
+###
+# The stage that replaces sampling and full hashing for small groups.
+# It works on whole groups, not single files.
+###
+LOCKSTEP = ('lockstep', None, 'full_hash')
+
+
+def recall(cache:object, g:list, cached:set) -> None:
+    """
+    Fill in what the persistent cache knows about the files in g, and
+    add to cached the (file, attribute) pairs that it supplied. A hash
+    that was already set, by an earlier stage in this run, is not the
+    cache's doing.
+    """
+    for f in g:
+        missing = [a for a in ('hash', 'full_hash') if not getattr(f, a)]
+        if missing and cache.recall(f):
+            cached.update((id(f), a) for a in missing if getattr(f, a))
+
+
+def readahead_ranges(f:FileClass, stage:str) -> tuple:
+    """
+    The parts of f that a stage is about to read.
+    """
+    if stage == 'fingerprint':
+        return ((0, FileClass.HASHBLOCK), (int(f) - FileClass.HASHBLOCK, FileClass.HASHBLOCK))
+    if stage == 'full':
+        return ((0, 0),)
+    # The sampled blocks are too small and scattered to be worth it.
+    return ()
+
+
+def with_readahead(work:list, sched:scheduler.DeviceScheduler) -> list:
+    """
+    Attach to each (stage function, file, stage name) job the file
+    that should be prefetched while it runs. Each device's readers
+    work through its queue in order, so the file that a reader will
+    pick up after this one is `readers` places further along.
+    """
+    if not iohints.enabled: return [(*job, None) for job in work]
+
+    by_device = collections.defaultdict(list)
+    for job in work:
+        by_device[scheduler.device_of(job[1])].append(job)
+
+    jobs = []
+    for dev, queue in by_device.items():
+        step = sched.readers_for(dev)
+        for i, job in enumerate(queue):
+            after = queue[i+step] if i + step < len(queue) else None
+            jobs.append((*job, after))
+    return jobs
+
+
+def run_job(job:tuple) -> object:
+    """
+    Prefetch the next file, then run one stage on one file. This is
+    what the scheduler's threads execute.
+    """
+    stage, f, name, after = job
+    if after is not None:
+        _, g, next_name = after
+        iohints.prefetch(g.name, readahead_ranges(g, next_name))
+    return stage(f)
+
+
+def batches(groups:Iterable[tuple], batch_size:int) -> Iterator[list]:
+    """
+    Gather size groups into lists holding about batch_size files, so
+    that there is enough work in flight to keep every reader busy.
+    """
+    batch = []
+    n = 0
+    for size, records in groups:
+        batch.append((size, records))
+        n += len(records)
+        if n >= batch_size:
+            yield batch
+            batch = []
+            n = 0
+    if batch: yield batch
+
+
+def duplicates(groups:Iterable[tuple],
+    samples:int=FileClass.SAMPLES,
+    stats:collections.Counter=None,
+    sched:scheduler.DeviceScheduler=None,
+    batch_size:int=DEFAULT_BATCH,
+    read_order:str='none',
+    compare_order:str=None,
+    lockstep_max:int=0,
+    on_batch:Callable=None) -> Iterator[tuple]:
+    """
+    Run each group of same-sized files through the stages.
+
+    groups -- an iterable of (size, [FileRecord, ... ]).
+    samples -- the number of interior blocks in the sampled stage.
+    stats -- if supplied, a Counter that accumulates the number of files
+        and the number of bytes read at each stage, the number of
+        hashes the persistent cache supplied, and the bytes a naive
+        full hash of every candidate would have read.
+    sched -- the DeviceScheduler that does the reading. If None, a
+        scheduler with the default number of readers per device is
+        used.
+    batch_size -- roughly how many files are hashed at once.
+    read_order -- how to order each stage's reads; one of
+        readorder.ORDERS. stats['read seconds'] accumulates the time
+        spent reading.
+    compare_order -- if supplied, every other file in each stage is
+        read in this order instead, after the others, and
+        stats[f"read seconds {order}"] and stats[f"read bytes {order}"]
+        are kept for both orders, so that one run shows what the
+        ordering is worth.
+    lockstep_max -- once a group has this many members or fewer, the
+        remaining stages are replaced by compare.lockstep. 0 means
+        always hash.
+    on_batch -- if supplied, called with the sizes in each batch once
+        every duplicate in the batch has been yielded.
+
+    yields -- (size, [FileClass, ... ]) for each set of files whose
+        full hashes agree. Every FileClass has its hash and full_hash
+        filled in.
+    """
+    if stats is None: stats = collections.Counter()
+
+    ###
+    # A scheduler made here is closed, and its pools shut down, when
+    # the generator finishes or is closed.
+    ###
+    with contextlib.ExitStack() as stack:
+        if sched is None: sched = stack.enter_context(scheduler.DeviceScheduler())
+
+        for batch in batches(groups, batch_size):
+            ###
+            # live is a list of [size, stages, [FileClass, ... ]]. At each
+            # step every group's next stage is run, all in one go, by the
+            # scheduler. FileClass caches its hashes, so the partitioning
+            # that follows reads nothing.
+            ###
+            live = []
+            for size, records in batch:
+                stats['candidates'] += len(records)
+                stats['naive bytes'] += size * len(records)
+                live.append((size, stages_for(size, samples)[:1] + [LOCKSTEP]
+                    if len(records) <= lockstep_max else stages_for(size, samples),
+                    [FileClass(r.name, r) for r in records]))
+
+            cache = fileclass.hash_cache
+            if cache is not None: cache.prime(f for _, _, g in live for f in g)
+            cached = set()
+
+            while live:
+                work = []
+                group_work = []
+                for i, (size, stages, g) in enumerate(live):
+                    if cache is not None:
+                        recall(cache, g, cached)
+                        ###
+                        # If the cache knows every full hash in the group,
+                        # the cheaper stages have nothing left to tell us.
+                        ###
+                        if len(stages) > 1 and all(f.full_hash for f in g):
+                            stages = stages[-1:]
+                            live[i] = (size, stages, g)
+
+                    name, stage, attribute = stages[0]
+                    if name == 'lockstep':
+                        stats['lockstep files'] += len(g)
+                        group_work.append((i, g))
+                        continue
+
+                    for f in g:
+                        if getattr(f, attribute):
+                            if (id(f), attribute) in cached: stats[f"{name} cached"] += 1
+                            continue
+                        stats[f"{name} files"] += 1
+                        stats[f"{name} bytes"] += bytes_read(size, name, samples)
+                        work.append((stage, f, name))
+
+                start = time.perf_counter()
+                for how, jobs in ([(read_order, work)] if compare_order is None else
+                    [(read_order, work[0::2]), (compare_order, work[1::2])]):
+                    jobs = readorder.order(jobs, how, file_of=lambda job : job[1])
+                    began = time.perf_counter()
+                    for _ in sched.run(run_job, with_readahead(jobs, sched),
+                        device=lambda job : scheduler.device_of(job[1])): pass
+                    stats[f"read seconds {how}"] += time.perf_counter() - began
+                    stats[f"read bytes {how}"] += sum(bytes_read(int(f), name, samples)
+                        for _, f, name in jobs)
+
+                compared = {}
+                for (i, g), result in sched.run(lambda job : compare.lockstep(job[1]),
+                    group_work, device=lambda job : scheduler.device_of(job[1][0])):
+                    parts, n = result if result is not None else ([], 0)
+                    stats['lockstep bytes'] += n
+                    compared[i] = parts
+                stats['read seconds'] += time.perf_counter() - start
+
+                next_live = []
+                for i, (size, stages, g) in enumerate(live):
+                    parts = compared[i] if i in compared else partition(g, stages[0][1])
+                    for part in parts:
+                        if len(stages) > 1:
+                            rest = stages[1:]
+                            if len(part) <= lockstep_max: rest = [LOCKSTEP]
+                            next_live.append((size, rest, part))
+                        else:
+                            stats['duplicates'] += len(part)
+                            yield size, part
+                live = next_live
+
+            if cache is not None: cache.flush()
+            if on_batch is not None: on_batch([size for size, _ in batch])
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Score every file in the metadata table as a candidate for removal,
+and report the worst offenders. The score is on [0 .. 1) for a file
+with no copies:
+
+    age  -- 1 - exp(-days since last access / AGE_DAYS). A file
+            whose last access came within STALE_DAYS of its last
+            modification was read only when it was written, and its
+            age counts for more: the square root is taken.
+    size -- 1 - exp(-bytes / SIZE_SCALE).
+
+    score = age * size * copies
+
+where copies is the number of files with the same contents, so a
+duplicated hog may score as high as the number of its copies. Files
+that are too small or too young score zero.
+
+The columns are read from one cursor, FETCH rows at a time, into a
+preallocated NumPy array of chunk rows, and the scores are computed
+a chunk at a time. Only the best top files are kept between chunks,
+so memory is fixed by the chunk size and top, not by the number of
+rows.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import textwrap
+import time
+
+###
+# Installed libraries.
+###
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+###
+# From hpclib
+###
+from   sqlitedb import SQLiteDB
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import hash
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+AGE_DAYS = 365.0
+STALE_DAYS = 1.0
+SIZE_SCALE = float(1 << 30)
+DAY = 86400.0
+
+DEFAULT_CHUNK = 1 << 18
+DEFAULT_TOP = 100
+FETCH = 4096
+
+###
+# The number of files sharing each hash, for the files that have a
+# copy. It is built once, in the database, rather than in memory.
+###
+copies_statement = textwrap.dedent(f"""
+    CREATE TEMP TABLE IF NOT EXISTS copies AS
+        SELECT h.file_id AS file_id, c.n AS n
+        FROM hashes AS h JOIN (
+            SELECT hash, COUNT(*) AS n FROM hashes
+            WHERE hash != '{hash.ZERO_HASH}'
+            GROUP BY hash HAVING COUNT(*) > 1) AS c
+        ON h.hash = c.hash;
+    """).strip()
+
+copies_index_statement = textwrap.dedent("""
+    CREATE INDEX IF NOT EXISTS temp.copies_idx ON copies(file_id);
+    """).strip()
+
+rows_statement = textwrap.dedent("""
+    SELECT m.rowid, m.filesize, m.mtime, m.atime, COALESCE(c.n, 1)
+    FROM metadata AS m LEFT JOIN copies AS c ON c.file_id = m.rowid
+    WHERE NOT m.deleted AND m.filesize >= ?;
+    """).strip()
+
+name_statement = textwrap.dedent("""
+    SELECT directory_name, filename, filesize FROM metadata WHERE rowid = ?;
+    """).strip()
+
+
+def positive(s:str) -> int:
+    """
+    An argparse type for counts that must be at least 1.
+    """
+    n = int(s)
+    if n < 1: raise argparse.ArgumentTypeError(f"{s} is not a positive integer.")
+    return n
+
+
+def chunks(db:SQLiteDB, min_size:int, chunk:int) -> Iterator[object]:
+    """
+    The rows of rows_statement, as NumPy arrays of up to chunk rows.
+    The same array is refilled each time, so use each one before
+    asking for the next. No more than FETCH rows exist as Python
+    tuples at once.
+    """
+    a = np.empty((chunk, 5), dtype=np.float64)
+    cursor = db.cursor
+    cursor.execute(rows_statement, (min_size,))
+    n = 0
+    while (rows := cursor.fetchmany(min(FETCH, chunk - n))):
+        a[n:n+len(rows)] = rows
+        n += len(rows)
+        if n == chunk:
+            yield a
+            n = 0
+    if n: yield a[:n]
+
+
+def score(size:object, mtime:object, atime:object, copies:object,
+    now:float, young:float=0.0) -> object:
+    """
+    The scores of a chunk of files. Every argument but now and young
+    is a NumPy array of the same length.
+
+    young -- files modified fewer than this many days ago score zero.
+    """
+    idle = np.maximum(now - atime, 0.0) / DAY
+    age = -np.expm1(-idle / AGE_DAYS)
+    stale = (atime - mtime) < STALE_DAYS * DAY
+    age = np.where(stale, np.sqrt(age), age)
+    bulk = -np.expm1(-size / SIZE_SCALE)
+    s = age * bulk * copies
+    if young: s[(now - mtime) < young * DAY] = 0.0
+    return s
+
+
+@trap
+def top_hogs(db:SQLiteDB,
+    top:int=DEFAULT_TOP,
+    min_size:int=0,
+    young:float=0.0,
+    chunk:int=DEFAULT_CHUNK) -> tuple:
+    """
+    Score every file, a chunk at a time.
+
+    returns -- (rowids, scores, rows scored), the rowids and scores
+        of the top files, best first.
+    """
+    db.execute_SQL(copies_statement)
+    db.execute_SQL(copies_index_statement)
+    now = time.time()
+
+    best_ids = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float64)
+    scored = 0
+    for a in chunks(db, min_size, chunk):
+        scored += len(a)
+
+        ids = np.concatenate((best_ids, a[:, 0].astype(np.int64)))
+        scores = np.concatenate((best_scores, score(a[:, 1], a[:, 2], a[:, 3], a[:, 4], now, young)))
+        if len(scores) > top:
+            keep = np.argpartition(scores, -top)[-top:]
+            ids, scores = ids[keep], scores[keep]
+        best_ids, best_scores = ids, scores
+
+    order = np.argsort(best_scores)[::-1]
+    return best_ids[order], best_scores[order], scored
+
+
+@trap
+def report(db:SQLiteDB, hogs:int=0, top:int=DEFAULT_TOP,
+    young:float=0.0, chunk:int=DEFAULT_CHUNK) -> int:
+    """
+    Print the top files, best first, as tab separated score, size,
+    and path.
+
+    hogs -- as with --big-file, a value of 20 or more is the binary
+        logarithm of the smallest file considered; 0 considers all.
+    """
+    if np is None:
+        print("The hogs report requires NumPy.")
+        return os.EX_UNAVAILABLE
+
+    min_size = 1 << hogs if hogs else 0
+    start = time.perf_counter()
+    ids, scores, scored = top_hogs(db, top, min_size, young, chunk)
+    for rowid, s in zip(ids.tolist(), scores.tolist()):
+        dirname, filename, size = db.execute_SQL(name_statement, rowid)[0]
+        print(f"{s:.6f}\t{size}\t{os.path.join(dirname, filename)}")
+
+    elapsed = time.perf_counter() - start
+    print(f"# {scored} files scored in {elapsed:.1f}s.", file=sys.stderr)
+    return os.EX_OK
+
+
+@trap
+def hogs_main(myargs:argparse.Namespace) -> int:
+    return report(SQLiteDB(myargs.db), myargs.hogs, myargs.top, myargs.young_file, myargs.chunk)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="hogs",
+        description="Rank the files in an undeux database as candidates for removal.")
+    parser.add_argument('--chunk', type=positive, default=DEFAULT_CHUNK,
+        help=f"Rows scored at a time. Default is {DEFAULT_CHUNK}")
+    parser.add_argument('--db', type=str, default='undeux.db',
+        help="Name of the database. Default is undeux.db")
+    parser.add_argument('--hogs', type=int, default=0, choices=[0, *range(20, 34)],
+        help="Consider only files of at least 2**hogs bytes. Default is 0, i.e., all files.")
+    parser.add_argument('--top', type=positive, default=DEFAULT_TOP,
+        help=f"Number of files reported. Default is {DEFAULT_TOP}")
+    parser.add_argument('--young-file', type=float, default=0.0,
+        help="Files modified within this many days score zero. Default is 0.")
+
+    myargs = parser.parse_args()
+    sys.exit(hogs_main(myargs))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Page cache hints for the hashing paths. Hashing terabytes on a shared
+node would otherwise push everyone else's working set out of memory
+for the sake of pages we will never read again. When enabled, each
+file is opened with POSIX_FADV_SEQUENTIAL, released with
+POSIX_FADV_DONTNEED when we are finished with it, and the next file
+in the queue can be requested early with POSIX_FADV_WILLNEED.
+
+On platforms without posix_fadvise, everything here does nothing.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import contextlib
+
+###
+# From hpclib
+###
+
+###
+# imports and objects that are a part of this project
+###
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+available = hasattr(os, 'posix_fadvise')
+
+###
+# Set to True by the programs' --fadvise switch.
+###
+enabled = False
+
+
+def advise(fd:int, advice:int, offset:int=0, length:int=0) -> None:
+    """
+    posix_fadvise, minus the exceptions. A hint that fails is a hint
+    not taken.
+    """
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def advised(f:typing.BinaryIO) -> Iterator[typing.BinaryIO]:
+    """
+    Wrap the reading of an open file: sequential access going in,
+    and drop the pages on the way out.
+
+    with open(name, 'rb') as f, iohints.advised(f):
+        ...
+    """
+    if not (enabled and available):
+        yield f
+        return
+
+    fd = f.fileno()
+    advise(fd, os.POSIX_FADV_SEQUENTIAL)
+    try:
+        yield f
+    finally:
+        advise(fd, os.POSIX_FADV_DONTNEED)
+
+
+def prefetch(name:str, ranges:Iterable[tuple]=((0, 0),)) -> None:
+    """
+    Start the kernel reading part of a file we will want shortly.
+    The readahead continues after the descriptor is closed.
+
+    name -- the file, or None to do nothing.
+    ranges -- (offset, length) pairs; a length of 0 means to the end.
+    """
+    if not (enabled and available and name): return
+    try:
+        fd = os.open(name, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        for offset, length in ranges:
+            advise(fd, os.POSIX_FADV_WILLNEED, max(0, offset), length)
+    finally:
+        os.close(fd)
+
+
+def evict(name:str) -> None:
+    """
+    Drop a file's pages from the page cache whether or not hints are
+    enabled. It requires no privileges.
+    """
+    if not available: return
+    try:
+        with open(name, 'rb') as f:
+            advise(f.fileno(), os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
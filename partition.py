@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Divide the hashing work evenly. A bucket chosen by hashing the file
+name holds about the same number of files as any other, but the
+bytes to be read can differ by orders of magnitude, and the worker
+that draws the bucket with the disc images finishes hours after the
+rest.
+
+After the scan, the size groups that need hashing (those with more
+than one member) are dealt to the buckets largest first, each to the
+bucket with the fewest bytes so far. A size group is never split, so
+the files that must be compared with each other are hashed together.
+
+Within a bucket, the work is cut into units of roughly equal bytes,
+largest first, and handed out one unit at a time to whichever worker
+is free. Nobody is left holding a long queue of their own.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import heapq
+import textwrap
+
+###
+# From hpclib
+###
+import sqlitedb
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import dupgroups
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+DEFAULT_BUCKETS = 100
+
+###
+# Small files are handed to the workers in bundles of about this
+# many bytes; a file larger than this is a unit by itself.
+###
+UNIT_BYTES = 1 << 26
+
+clear_buckets_statement = textwrap.dedent("""
+    UPDATE metadata SET bucket = NULL WHERE bucket IS NOT NULL;
+    """).strip()
+
+set_bucket_statement = textwrap.dedent("""
+    UPDATE metadata SET bucket = ? WHERE filesize = ? AND NOT deleted;
+    """).strip()
+
+unassigned_statement = textwrap.dedent("""
+    SELECT COUNT(*) FROM metadata
+    WHERE bucket IS NULL AND NOT deleted
+        AND filesize IN (SELECT filesize FROM size_groups);
+    """).strip()
+
+
+def balance(groups:Iterable[tuple], n:int=DEFAULT_BUCKETS) -> tuple:
+    """
+    Deal the size groups to n buckets, largest first, each to the
+    least loaded bucket.
+
+    groups -- (size, count) pairs.
+
+    returns -- ({size : bucket}, [bytes in each bucket])
+    """
+    loads = [(0, b) for b in range(n)]
+    assignment = {}
+    for size, count in sorted(groups, key=lambda g : g[0]*g[1], reverse=True):
+        load, b = heapq.heappop(loads)
+        assignment[size] = b
+        heapq.heappush(loads, (load + size*count, b))
+
+    totals = [0]*n
+    for load, b in loads: totals[b] = load
+    return assignment, totals
+
+
+def unassigned(db:sqlitedb.SQLiteDB) -> int:
+    """
+    The number of files that need hashing but have no bucket.
+    """
+    return db.execute_SQL(unassigned_statement)[0][0]
+
+
+@trap
+def assign_buckets(db:sqlitedb.SQLiteDB, n:int=DEFAULT_BUCKETS) -> list:
+    """
+    Give every file that needs hashing a bucket in [0 .. n), balanced
+    by bytes. Files that are alone in their size have no bucket.
+    size_groups is brought up to date first.
+
+    returns -- the bytes in each bucket.
+    """
+    dupgroups.refresh_sizes(db)
+    assignment, totals = balance(db.execute_SQL("SELECT filesize, members FROM size_groups;"), n)
+    db.execute_SQL(clear_buckets_statement)
+    db.cursor.executemany(set_bucket_statement,
+        ((b, size) for size, b in assignment.items()))
+    db.commit()
+    return totals
+
+
+def work_units(tasks:Iterable, size_of:Callable, unit_bytes:int=UNIT_BYTES) -> list:
+    """
+    Bundle tasks into units of about unit_bytes, largest first.
+
+    tasks -- anything.
+    size_of -- the bytes a task will read.
+
+    returns -- [[task, ... ], ... ]
+    """
+    units = []
+    unit = []
+    unit_size = 0
+    for task in sorted(tasks, key=size_of, reverse=True):
+        unit.append(task)
+        unit_size += size_of(task)
+        if unit_size >= unit_bytes:
+            units.append(unit)
+            unit = []
+            unit_size = 0
+
+    if unit: units.append(unit)
+    return units
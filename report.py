@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+The report of confirmed duplicates, for the tools that clean up
+after undeux. The groups are read from SQLite largest size first,
+a few thousand rows at a time from one cursor, and each group is
+written as soon as its last member has been read. Only one group is
+ever held in memory, however many there are.
+
+    jsonl -- one object per group, with its size, hash, members,
+             copies, wasted bytes, and paths, then one object with the
+             totals.
+    csv   -- one row per file, with its group's size, hash, members,
+             copies, and wasted bytes. The totals go to stderr.
+
+The members of a group are its paths, and its copies are the distinct
+inodes among them. Hard links take no extra space, so a group wastes
+size * (copies - 1) bytes, however many links are listed.
+
+The groups come either from the table written by a run of undeux,
+or from the duplicates view that calchashes.py keeps up to date.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import csv
+import itertools
+import json
+import textwrap
+import time
+
+###
+# From hpclib
+###
+from   sqlitedb import SQLiteDB
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import dupgroups
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+FORMATS = ('jsonl', 'csv')
+DEFAULT_FETCH = 10000
+
+CSV_HEADER = ('group', 'size', 'hash', 'members', 'copies', 'wasted', 'path')
+
+###
+# A run's table is read backwards along this index, so the rows
+# arrive largest size first, with each group's rows together, and
+# SQLite never sorts.
+###
+run_index_statement = lambda table_name : textwrap.dedent(f"""
+    CREATE INDEX IF NOT EXISTS rpt{table_name} ON {table_name}(bucket, fullhash);
+    """).strip()
+
+run_rows_statement = lambda table_name, inodes : textwrap.dedent(f"""
+    SELECT bucket, fullhash, dirname, filename, {inodes} FROM {table_name}
+    ORDER BY bucket DESC, fullhash DESC;
+    """).strip()
+
+###
+# The duplicates view is read in the order of dup_size_idx.
+###
+duplicate_rows_statement = lambda inodes : textwrap.dedent(f"""
+    SELECT filesize, hash, directory_name, filename, {inodes} FROM duplicates
+    ORDER BY filesize DESC, group_id;
+    """).strip()
+
+
+def inode_columns(db:SQLiteDB, name:str) -> str:
+    """
+    The device and inode columns of a table or view. Those written
+    before the columns were added have neither, and then every path
+    is taken to be a separate copy.
+    """
+    columns = {row[1] for row in db.execute_SQL(f"PRAGMA table_info({name});")}
+    return 'device, inode' if {'device', 'inode'} <= columns else 'NULL, NULL'
+
+
+def rows_of(db:SQLiteDB, SQL:str, fetch:int=DEFAULT_FETCH) -> Iterator[tuple]:
+    """
+    The rows of a query, fetch at a time.
+    """
+    cursor = db.cursor
+    cursor.execute(SQL)
+    while (rows := cursor.fetchmany(fetch)):
+        yield from rows
+
+
+def groups_of(rows:Iterable[tuple]) -> Iterator[tuple]:
+    """
+    rows -- (size, hash, dirname, filename, device, inode), with the
+        rows of each group together.
+
+    yields -- (size, hash, [path, ... ], copies) for every group of two
+        or more files, where copies is the number of distinct inodes.
+    """
+    for (size, digest), members in itertools.groupby(rows, key=lambda r : r[:2]):
+        paths = []
+        inodes = set()
+        for _, _, d, f, dev, ino in members:
+            paths.append(path := os.path.join(d, f))
+            inodes.add(path if ino is None else (dev, ino))
+        if len(paths) > 1: yield size, digest, paths, len(inodes)
+
+
+def write(groups:Iterable[tuple], out:TextIO, fmt:str='jsonl') -> dict:
+    """
+    Write each group as it arrives.
+
+    returns -- the totals: groups, files, and wasted bytes.
+    """
+    totals = {'groups' : 0, 'files' : 0, 'wasted' : 0}
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(CSV_HEADER)
+
+    for group, (size, digest, paths, copies) in enumerate(groups, start=1):
+        members = len(paths)
+        wasted = size * (copies - 1)
+        totals['groups'] += 1
+        totals['files'] += members
+        totals['wasted'] += wasted
+        if fmt == 'csv':
+            writer.writerows((group, size, digest, members, copies, wasted, p) for p in paths)
+        else:
+            out.write(json.dumps({'group' : group, 'size' : size, 'hash' : digest,
+                'members' : members, 'copies' : copies, 'wasted' : wasted,
+                'paths' : paths}) + "\n")
+
+    if fmt == 'csv':
+        print("# " + " ".join(f"{k}={v}" for k, v in totals.items()), file=sys.stderr)
+    else:
+        out.write(json.dumps({'totals' : totals}) + "\n")
+    out.flush()
+    return totals
+
+
+@trap
+def report(db:SQLiteDB, table_name:str=None, fmt:str='jsonl',
+    out:TextIO=None, fetch:int=DEFAULT_FETCH) -> dict:
+    """
+    Stream the duplicate groups to out, largest size first.
+
+    table_name -- the table written by a run of undeux. If None, the
+        groups come from the duplicates view.
+    out -- defaults to sys.stdout, so -o/--output applies.
+
+    returns -- the totals.
+    """
+    if out is None: out = sys.stdout
+    if table_name is None:
+        dupgroups.prepare(db)
+        SQL = duplicate_rows_statement(inode_columns(db, 'duplicates'))
+    else:
+        db.execute_SQL(run_index_statement(table_name))
+        SQL = run_rows_statement(table_name, inode_columns(db, table_name))
+
+    return write(groups_of(rows_of(db, SQL, fetch)), out, fmt)
+
+
+@trap
+def report_main(myargs:argparse.Namespace) -> int:
+    start = time.perf_counter()
+    out = open(myargs.output, 'w', newline='') if myargs.output else sys.stdout
+    totals = report(SQLiteDB(myargs.db), myargs.table, myargs.format, out, myargs.fetch)
+    if out is not sys.stdout: out.close()
+    print(f"# {totals['groups']} groups reported in {time.perf_counter()-start:.1f}s.",
+        file=sys.stderr)
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="report",
+        description="Write the confirmed duplicates in an undeux database, largest first.")
+    parser.add_argument('--db', type=str, default='undeux.db',
+        help="Name of the database. Default is undeux.db")
+    parser.add_argument('--fetch', type=int, default=DEFAULT_FETCH,
+        help=f"Rows fetched from the database at a time. Default is {DEFAULT_FETCH}")
+    parser.add_argument('--format', choices=FORMATS, default='jsonl',
+        help="Format of the report. Default is jsonl.")
+    parser.add_argument('-o', '--output', type=str, default="",
+        help="Write the report here rather than to stdout.")
+    parser.add_argument('--table', type=str, default=None,
+        help="Report the groups in the table written by a run of undeux, rather than those found by calchashes.py.")
+
+    myargs = parser.parse_args()
+    sys.exit(report_main(myargs))
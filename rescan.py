@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental rescanning. The inode and mtime of every directory are
+recorded in the database along with the files it holds. On the next
+run, a directory whose inode and mtime have not changed is not listed
+again; its files are read back from the metadata table instead.
+
+A directory's mtime changes when an entry is added, removed, or
+renamed, but not when a file in it is rewritten in place. The files
+of an unlisted directory are therefore stat-ed again once they are
+known to be candidates, before any hash is looked up, so that a file
+rewritten in place is never matched to its old hashes. A candidate
+that has vanished or changed size is dropped from this run, and its
+directory is listed again on the next one.
+
+When a directory is listed again, files that have vanished are marked
+deleted, and files that are unchanged keep their rows, so their rows
+in hashes remain valid.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import collections
+import textwrap
+
+###
+# From hpclib
+###
+import sqlitedb
+
+###
+# imports and objects that are a part of this project
+###
+from   fileclass import FileRecord
+import walker
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+###
+# Rows are written in batches of this many.
+###
+FLUSH_ROWS = 50000
+
+schema_statements = (
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS metadata (
+        filename text,
+        directory_name,
+        inode integer,
+        nlinks integer,
+        filesize integer,
+        mtime datetime,
+        atime datetime,
+        bucket integer,
+        rowid integer primary key,
+        device integer,
+        ctime datetime,
+        deleted integer default 0
+        );
+    """).strip(),
+    textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS directories (
+        dirname text primary key,
+        parent text,
+        inode integer,
+        device integer,
+        mtime real,
+        deleted integer default 0
+        );
+    """).strip(),
+    "CREATE INDEX IF NOT EXISTS dir_idx ON metadata(directory_name);",
+    "CREATE INDEX IF NOT EXISTS parent_idx ON directories(parent);"
+    )
+
+###
+# Databases built from an older undeux.sql lack these columns.
+###
+added_columns = {
+    'device' : 'integer',
+    'ctime' : 'datetime',
+    'deleted' : 'integer default 0'
+    }
+
+stored_files_statement = textwrap.dedent("""
+    SELECT filename, filesize, inode, device, mtime, nlinks, ctime
+    FROM metadata WHERE directory_name = ? AND NOT deleted;
+    """).strip()
+
+###
+# A relisted directory's rows are first all marked deleted. A file
+# that is unchanged gets its row back, with the same rowid and so
+# the same row in hashes. A file that is new or has changed gets a
+# new row; the old one stays deleted, and no rowid is ever reused.
+###
+revive_file_statement = textwrap.dedent("""
+    UPDATE metadata SET deleted = 0, nlinks = ?, atime = ?
+    WHERE directory_name = ? AND filename = ? AND inode = ? AND device IS ?
+        AND filesize = ? AND mtime = ? AND ctime IS ?;
+    """).strip()
+
+insert_file_statement = textwrap.dedent("""
+    INSERT INTO metadata
+        (filename, directory_name, inode, nlinks, filesize, mtime, atime, device, ctime)
+    SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM metadata
+        WHERE directory_name = ? AND filename = ? AND NOT deleted);
+    """).strip()
+
+upsert_directory_statement = textwrap.dedent("""
+    INSERT OR REPLACE INTO directories
+        (dirname, parent, inode, device, mtime, deleted)
+    VALUES (?, ?, ?, ?, ?, 0);
+    """).strip()
+
+delete_directory_statement = textwrap.dedent("""
+    UPDATE directories SET deleted = 1 WHERE dirname = ?;
+    """).strip()
+
+delete_directory_files_statement = textwrap.dedent("""
+    UPDATE metadata SET deleted = 1 WHERE directory_name = ?;
+    """).strip()
+
+###
+# A directory whose stored files turned out to be stale is listed
+# on the next run, whatever its mtime.
+###
+stale_directory_statement = textwrap.dedent("""
+    UPDATE directories SET mtime = NULL WHERE dirname = ?;
+    """).strip()
+
+
+def prepare(db:sqlitedb.SQLiteDB) -> None:
+    """
+    Create the tables if they are not there, and bring an older
+    metadata table up to date.
+    """
+    for statement in schema_statements:
+        db.execute_SQL(statement)
+
+    present = {row[1] for row in db.execute_SQL("PRAGMA table_info(metadata);")}
+    for column, decl in added_columns.items():
+        if column not in present:
+            db.execute_SQL(f"ALTER TABLE metadata ADD COLUMN {column} {decl};")
+
+
+class IncrementalLister:
+    """
+    A replacement for walker.list_directory. The listing decisions are
+    made in the walker's threads from what was loaded when the lister
+    was built; every database operation happens in the thread that
+    consumes walker.scan_tree.
+
+    lister = IncrementalLister(db)
+    for f, st in walker.scan_tree(top, lister=lister):
+        ...
+    lister.finish()
+    """
+
+    def __init__(self, db:sqlitedb.SQLiteDB, include_hidden:bool=False,
+        exclude:object=None) -> None:
+        prepare(db)
+        self.db = db
+        self.include_hidden = include_hidden
+        self.exclude = exclude
+        self.known = {}
+        self.children = collections.defaultdict(list)
+        for dirname, parent, inode, device, mtime in db.execute_SQL(
+            "SELECT dirname, parent, inode, device, mtime FROM directories WHERE NOT deleted;"):
+            self.known[dirname] = (inode, device, mtime)
+            self.children[parent].append(dirname)
+
+        self.visited = set()
+        self.skipped = set()
+        self.forget = []
+        self.inserts = []
+        self.upserts = []
+        self.stats = collections.Counter()
+
+
+    def __call__(self, d:str) -> tuple:
+        """
+        Runs in a walker thread. One stat of the directory decides
+        whether it needs to be listed.
+        """
+        try:
+            st = os.stat(d)
+        except OSError:
+            return [], []
+
+        if self.known.get(d) == (st.st_ino, st.st_dev, st.st_mtime):
+            subdirs = list(self.children.get(d, ()))
+            if self.exclude is not None: subdirs = self.exclude.prune(subdirs)
+            return self.reused(d), subdirs
+
+        files, subdirs = walker.list_directory(d, self.include_hidden, self.exclude)
+        return self.listed(d, st, files), subdirs
+
+
+    def reused(self, d:str) -> Iterator[tuple]:
+        """
+        Consumed in the main thread: the stored rows for d.
+        """
+        self.visited.add(d)
+        self.skipped.add(d)
+        self.stats['skipped'] += 1
+        for filename, size, inode, device, mtime, nlinks, ctime in self.db.execute_SQL(
+            stored_files_statement, d):
+            self.stats['reused files'] += 1
+            yield os.path.join(d, filename), FileRecord(filename, size, inode, device,
+                mtime, nlinks, ctime)
+
+
+    def listed(self, d:str, st:os.stat_result, files:list) -> Iterator[tuple]:
+        """
+        Consumed in the main thread: record what the listing found,
+        then pass it along.
+        """
+        self.visited.add(d)
+        self.stats['relisted' if d in self.known else 'new'] += 1
+        self.forget.append((d,))
+        self.upserts.append((d, os.path.dirname(d), st.st_ino, st.st_dev, st.st_mtime))
+        for path, fst in files:
+            if fst is not None:
+                self.inserts.append((os.path.basename(path), d, fst.st_ino, fst.st_nlink,
+                    fst.st_size, fst.st_mtime, fst.st_atime, fst.st_dev, fst.st_ctime))
+            yield path, fst
+
+        if len(self.inserts) >= FLUSH_ROWS: self.flush()
+
+
+    def flush(self) -> None:
+        """
+        Bring the stored rows of the relisted directories up to date.
+        The rows of files that have vanished are left marked deleted.
+        """
+        cursor = self.db.cursor
+        if self.forget: cursor.executemany(delete_directory_files_statement, self.forget)
+        if self.inserts:
+            cursor.executemany(revive_file_statement,
+                ((nlinks, atime, d, name, ino, dev, size, mtime, ctime)
+                for name, d, ino, nlinks, size, mtime, atime, dev, ctime in self.inserts))
+            cursor.executemany(insert_file_statement,
+                ((*row, row[1], row[0]) for row in self.inserts))
+        if self.upserts: cursor.executemany(upsert_directory_statement, self.upserts)
+        self.db.commit()
+        self.forget = []
+        self.inserts = []
+        self.upserts = []
+
+
+    def finish(self, roots:Iterable[str]=()) -> collections.Counter:
+        """
+        Write what is left, and mark as deleted the directories beneath
+        roots that were known before but were not seen this time.
+
+        returns -- counts of directories skipped, relisted, new, and
+            deleted.
+        """
+        self.flush()
+        roots = tuple(os.path.join(r, '') for r in roots)
+        gone = [(d,) for d in self.known
+            if d not in self.visited and (not roots or d.startswith(roots))]
+        self.db.cursor.executemany(delete_directory_statement, gone)
+        self.db.cursor.executemany(delete_directory_files_statement, gone)
+        self.db.commit()
+        self.stats['deleted'] = len(gone)
+        return self.stats
+
+
+    def refresh(self, groups:Iterable[tuple]) -> Iterator[tuple]:
+        """
+        The files reused from unlisted directories carry the facts
+        stored by the last run. Stat the ones that are still candidates,
+        so that the hash cache is consulted with their current size,
+        mtime, and ctime. Called in the main thread, on the groups as
+        they are hashed.
+
+        groups -- an iterable of (size, [FileRecord, ... ]).
+
+        yields -- the same groups, with the reused files brought up to
+            date, and without the files that have vanished, been
+            replaced, changed size, or gained or lost links.
+        """
+        stale = set()
+        try:
+            for size, records in groups:
+                kept = []
+                for r in records:
+                    d = os.path.dirname(r.name)
+                    if d not in self.skipped:
+                        kept.append(r)
+                        continue
+
+                    try:
+                        st = os.stat(r.name, follow_symlinks=False)
+                    except OSError:
+                        st = None
+                    if st is None or (st.st_size, st.st_ino, st.st_dev, st.st_nlink) != (
+                        size, r.st_ino, r.st_dev, r.st_nlink):
+                        self.stats['stale files'] += 1
+                        stale.add(d)
+                        continue
+
+                    if (st.st_mtime, st.st_ctime) != (r.st_mtime, r.st_ctime):
+                        self.stats['changed files'] += 1
+                        stale.add(d)
+                    kept.append(FileRecord(r.name, st.st_size, st.st_ino, st.st_dev,
+                        st.st_mtime, st.st_nlink, st.st_ctime))
+
+                if len(kept) > 1: yield size, kept
+
+        finally:
+            self.db.cursor.executemany(stale_directory_statement, ((d,) for d in stale))
+            self.db.commit()
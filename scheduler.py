@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+A scheduler for reading files in parallel with a separate limit on
+the number of concurrent readers for each device. A single global
+worker count either starves fast local NVMe or thrashes the spinning
+discs behind a parallel filesystem; a pool per st_dev does neither.
+
+xxhash releases the GIL for large buffers, and so does read(), so
+threads are sufficient here.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import collections
+import concurrent.futures
+
+###
+# From hpclib
+###
+
+###
+# imports and objects that are a part of this project
+###
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+DEFAULT_READERS = 2
+
+device_of = lambda f : f.inodedata.st_dev
+
+
+def parse_device_readers(specs:Iterable[str]) -> dict:
+    """
+    Turn ['/scratch=8', '/home=1'] into {st_dev : readers}. Any
+    path on the device will do; it is only used to find st_dev.
+    """
+    limits = {}
+    for spec in specs:
+        path, _, n = spec.rpartition('=')
+        limits[os.stat(path).st_dev] = int(n)
+    return limits
+
+
+class DeviceScheduler:
+    """
+    Run a function over many files, with at most readers[dev]
+    calls at once for files on device dev.
+
+    with DeviceScheduler(2, {nvme_dev:16}) as s:
+        for f, result in s.run(FileClass.fullfingerprint, files):
+            ...
+    """
+
+    def __init__(self, readers:int=DEFAULT_READERS, limits:dict=None,
+        device:Callable=device_of) -> None:
+        """
+        readers -- the default number of readers per device.
+        limits -- {st_dev : readers} for the devices that differ.
+        device -- how to find the st_dev of an item.
+        """
+        self.readers = max(1, readers)
+        self.limits = limits or {}
+        self.device = device
+        self.pools = {}
+        self.calls = collections.Counter()
+
+
+    def __enter__(self) -> object:
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.close()
+        return False
+
+
+    def readers_for(self, dev:int) -> int:
+        return max(1, self.limits.get(dev, self.readers))
+
+
+    def pool_for(self, dev:int) -> concurrent.futures.ThreadPoolExecutor:
+        if dev not in self.pools:
+            self.pools[dev] = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.readers_for(dev),
+                thread_name_prefix=f"dev{dev}")
+        return self.pools[dev]
+
+
+    @staticmethod
+    def _call(fn:Callable, item:object) -> tuple:
+        try:
+            return item, fn(item)
+        except Exception as e:
+            return item, None
+
+
+    def run(self, fn:Callable, items:Iterable, device:Callable=None) -> Iterator[tuple]:
+        """
+        Call fn(item) for every item, and yield (item, result) in the
+        order the calls finish. An item whose call raises an exception
+        is yielded with a result of None. Only the calling thread
+        sees the results, so it may safely be the one writing to
+        the database.
+
+        device -- overrides the scheduler's own way of finding the
+            st_dev of an item.
+        """
+        device = device or self.device
+        futures = []
+        for item in items:
+            dev = device(item)
+            self.calls[dev] += 1
+            futures.append(self.pool_for(dev).submit(self._call, fn, item))
+
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+    def close(self) -> None:
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+        self.pools = {}
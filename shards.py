@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded scanning for a Slurm job array. The top level directories
+(and any files directly beneath the roots) are dealt to the shards
+in name order, round robin, so every array task has a disjoint
+slice. Each task loads and hashes its slice into its own database,
+usually on node-local scratch:
+
+    python shards.py scan --shard $SLURM_ARRAY_TASK_ID \\
+        --shards $SLURM_ARRAY_TASK_COUNT --db $SCRATCH/shard.db dir ...
+
+When all of them are finished, the shard databases are merged:
+
+    python shards.py merge --db undeux.db shard.*.db
+
+A shard can only hash the files that have a same-sized partner in
+its own slice. After merging, the files whose partners are in other
+shards are hashed, and the duplicate groups are counted across the
+whole tree.
+
+The same thing can be done on one machine, with the shards running
+as separate processes:
+
+    python shards.py local --shards 4 --scratch /tmp --db undeux.db dir ...
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import contextlib
+import logging
+import subprocess
+import textwrap
+import time
+
+###
+# From hpclib
+###
+import fileutils
+from   sqlitedb import SQLiteDB
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import calchashes
+import dupgroups
+import fsgenerators
+import hash
+import partition
+import undeuxdb
+import urlogger
+import walker
+
+logger = urlogger.URLogger(logfile='undeux.log', level=logging.INFO)
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+shards_statement = textwrap.dedent("""
+    CREATE TABLE IF NOT EXISTS shards (
+        shard_id INTEGER PRIMARY KEY,
+        dbname TEXT,
+        first_id INTEGER,
+        last_id INTEGER
+        );
+    """).strip()
+
+copy_files_statement = textwrap.dedent("""
+    INSERT INTO metadata
+        (rowid, filename, directory_name, inode, nlinks, filesize,
+        mtime, atime, bucket, device, ctime, deleted)
+    SELECT rowid + ?, filename, directory_name, inode, nlinks, filesize,
+        mtime, atime, bucket, device, ctime, deleted
+    FROM shard.metadata;
+    """).strip()
+
+copy_hashes_statement = textwrap.dedent("""
+    INSERT INTO hashes (file_id, hash_size, hash)
+    SELECT file_id + ?, hash_size, hash FROM shard.hashes;
+    """).strip()
+
+###
+# Groups of two or more files with the same size and hash, and the
+# number of shards each group spans.
+###
+duplicate_groups_statement = textwrap.dedent(f"""
+    SELECT m.filesize, h.hash, COUNT(*), COUNT(DISTINCT s.shard_id)
+    FROM hashes AS h
+        JOIN metadata AS m ON m.rowid = h.file_id
+        JOIN shards AS s ON h.file_id BETWEEN s.first_id AND s.last_id
+    WHERE h.hash != '{hash.ZERO_HASH}' AND NOT m.deleted
+    GROUP BY m.filesize, h.hash
+    HAVING COUNT(*) > 1;
+    """).strip()
+
+
+def create_db(dbname:str) -> SQLiteDB:
+    """
+    A new, empty database with the undeux schema. Any old file of the
+    same name is removed.
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(dbname)
+    undeuxdb.build_schema(dbname, shards_statement)
+    return SQLiteDB(dbname)
+
+
+def slice_of(roots:Iterable[str], shard:int, shards:int) -> list:
+    """
+    This shard's share of the directories and files directly beneath
+    roots.
+    """
+    items = []
+    for root in roots:
+        files, subdirs = walker.list_directory(fileutils.expandall(root))
+        items.extend(subdirs)
+        items.extend(path for path, st in files if st is not None)
+    return sorted(items)[shard::shards]
+
+
+def rows_of_file(path:str) -> Iterator[tuple]:
+    """
+    The metadata row for a single file, as files_and_stats would
+    have produced it.
+    """
+    st = os.lstat(path)
+    if st.st_size:
+        d_part, f_part = os.path.split(path)
+        yield (f_part, d_part, st.st_ino, st.st_nlink, st.st_size, st.st_mtime,
+            st.st_atime, None, st.st_dev, st.st_ctime)
+
+
+@trap
+def scan_shard(myargs:argparse.Namespace) -> int:
+    """
+    Load and hash one shard's slice of the tree into myargs.db.
+    """
+    start = time.perf_counter()
+    db = create_db(myargs.db)
+    items = slice_of(myargs.dirs, myargs.shard, myargs.shards)
+    logger.info(f"shard {myargs.shard} of {myargs.shards}: {len(items)} items.")
+
+    rows = 0
+    for item in items:
+        if os.path.isdir(item):
+            blocks = fsgenerators.block_of_files(item, myargs.load_block, myargs.walkers)
+        else:
+            blocks = (list(rows_of_file(item)),)
+        rows += undeuxdb.load_files(db, blocks)
+
+    partition.assign_buckets(db)
+    stats = calchashes.hash_files_by_bucket(db, range(partition.DEFAULT_BUCKETS), myargs.cores)
+    logger.info(f"shard {myargs.shard}: {rows} files loaded, {stats['hashed']} hashed, "
+        f"in {time.perf_counter()-start:.1f}s.")
+    return os.EX_OK
+
+
+@trap
+def merge_shards(dbname:str, shard_dbs:Iterable[str], cores:int=1) -> dict:
+    """
+    Combine the shard databases into dbname, hash the files whose
+    partners were in other shards, and count the duplicate groups.
+
+    returns -- the summary that is logged.
+    """
+    db = create_db(dbname)
+    for shard_id, shard_db in enumerate(shard_dbs):
+        base = db.execute_SQL("SELECT COALESCE(MAX(rowid), 0) FROM metadata;")[0][0]
+        db.execute_SQL("ATTACH DATABASE ? AS shard;", shard_db)
+        db.execute_SQL(copy_files_statement, base)
+        db.execute_SQL(copy_hashes_statement, base)
+        last = db.execute_SQL("SELECT COALESCE(MAX(rowid), 0) FROM metadata;")[0][0]
+        db.execute_SQL("INSERT INTO shards VALUES (?, ?, ?, ?);", shard_id, shard_db, base+1, last)
+        db.commit()
+        db.execute_SQL("DETACH DATABASE shard;")
+        logger.info(f"{shard_db}: {last-base} files merged.")
+
+    partition.assign_buckets(db)
+    stats = calchashes.hash_files_by_bucket(db, range(partition.DEFAULT_BUCKETS), cores)
+    dupgroups.refresh_groups(db)
+
+    groups = db.execute_SQL(duplicate_groups_statement)
+    summary = {
+        'hashed after merging' : stats['hashed'],
+        'duplicate groups' : len(groups),
+        'cross-shard groups' : sum(1 for g in groups if g[3] > 1),
+        'duplicate files' : sum(g[2] for g in groups),
+        'wasted bytes' : sum(g[0] * (g[2]-1) for g in groups)
+        }
+    for k, v in summary.items():
+        logger.info(f"{k}: {v}")
+    return summary
+
+
+@trap
+def run_local(myargs:argparse.Namespace) -> int:
+    """
+    Run the shards as separate processes on this machine, then merge.
+    """
+    os.makedirs(myargs.scratch, exist_ok=True)
+    shard_dbs = [os.path.join(myargs.scratch, f"shard.{i}.db") for i in range(myargs.shards)]
+    procs = [ subprocess.Popen([sys.executable, os.path.abspath(__file__), 'scan',
+        '--shard', str(i), '--shards', str(myargs.shards), '--db', shard_db,
+        '--cores', str(myargs.cores), '--walkers', str(myargs.walkers), *myargs.dirs])
+        for i, shard_db in enumerate(shard_dbs) ]
+
+    if any(p.wait() for p in procs):
+        logger.error("at least one shard failed; not merging.")
+        return os.EX_SOFTWARE
+
+    merge_shards(myargs.db, shard_dbs, myargs.cores)
+    return os.EX_OK
+
+
+@trap
+def shards_main(myargs:argparse.Namespace) -> int:
+    if myargs.command == 'scan':
+        return scan_shard(myargs)
+    if myargs.command == 'merge':
+        merge_shards(myargs.db, myargs.shard_dbs, myargs.cores)
+        return os.EX_OK
+    return run_local(myargs)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="shards",
+        description="Scan a tree in shards, and merge the results.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help="scan and hash one shard.")
+    scan.add_argument('--shard', type=int,
+        default=int(os.environ.get('SLURM_ARRAY_TASK_ID', 0)),
+        help="This shard's number. Default is $SLURM_ARRAY_TASK_ID.")
+    scan.add_argument('--shards', type=int,
+        default=int(os.environ.get('SLURM_ARRAY_TASK_COUNT', 1)),
+        help="The number of shards. Default is $SLURM_ARRAY_TASK_COUNT.")
+    scan.add_argument('--load-block', type=int, default=undeuxdb.DEFAULT_BATCH,
+        help=f"Files passed from the walk to the database at a time. Default is {undeuxdb.DEFAULT_BATCH}")
+    scan.add_argument('dirs', nargs='+')
+
+    merge = commands.add_parser('merge', help="merge shard databases.")
+    merge.add_argument('shard_dbs', nargs='+')
+
+    local = commands.add_parser('local', help="run the shards and the merge on this machine.")
+    local.add_argument('--shards', type=int, default=4,
+        help="The number of shard processes. Default is 4.")
+    local.add_argument('--scratch', type=str, default=os.environ.get('TMPDIR', '/tmp'),
+        help="Where the shard databases are written. Default is $TMPDIR.")
+    local.add_argument('dirs', nargs='+')
+
+    for p in (scan, merge, local):
+        p.add_argument('-c', '--cores', type=int, default=1,
+            help="Number of cores to use for calculating hashes.")
+        p.add_argument('--db', type=str, required=True,
+            help="The shard database to write, or the merged database.")
+        p.add_argument('--walkers', type=int, default=walker.DEFAULT_WALKERS,
+            help=f"Number of directories listed concurrently. Default is {walker.DEFAULT_WALKERS}")
+
+    myargs = parser.parse_args()
+    sys.exit(shards_main(myargs))
@@ -27,6 +27,7 @@ import collections
 import contextlib
 from   datetime import date
 import enum
+import functools
 import getpass
 import hashlib
 from   logging import CRITICAL, ERROR, WARNING, INFO, DEBUG, NOTSET
@@ -49,6 +50,28 @@ from   sqlitedb import SQLiteDB
 from   urdecorators import trap
 from   urlogger import URLogger
 
+#####################################
+# From this project
+#####################################
+
+import candidates
+import checkpoint
+import compare
+import exclude
+import extsort
+import fsgenerators
+import hashcache
+import hashstages
+import hogs
+import iohints
+import partition
+import readorder
+import report
+import rescan
+import scheduler
+import undeuxdb
+import walker
+
 logger=None
 
 drop_table_statement = lambda table_name : textwrap.dedent(f"""
@@ -56,21 +79,23 @@ drop_table_statement = lambda table_name : textwrap.dedent(f"""
     """).strip()
 
 new_table_statement = lambda table_name : textwrap.dedent(f"""
-    CREATE TABLE {table_name} (
+    CREATE TABLE IF NOT EXISTS {table_name} (
         filename TEXT,
         dirname TEXT,
         bucket INTEGER DEFAULT NULL,
         fingerprint INTEGER DEFAULT NULL,
-        fullhash INTEGER DEFAULT NULL
+        fullhash INTEGER DEFAULT NULL,
+        device INTEGER DEFAULT NULL,
+        inode INTEGER DEFAULT NULL
         );
     """).strip()
 
 index_statement = lambda table_name : textwrap.dedent(f"""
-    CREATE INDEX idx{table_name} ON {table_name}(bucket, fingerprint);
+    CREATE INDEX IF NOT EXISTS idx{table_name} ON {table_name}(bucket, fingerprint);
     """).strip()
 
 insert_statement = lambda table_name : textwrap.dedent(f"""
-    INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?);
+    INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?, ?, ?);
     """).strip()
 
 false_positives = lambda table_name : textwrap.dedent(f"""
@@ -95,21 +120,6 @@ me = getpass.getuser()
 my_uid = pwd.getpwnam(me).pw_uid
 
 
-@trap
-def all_files_in(s:str, include_hidden:bool=False) -> str:
-    """
-    A generator to cough up the full file names for every
-    file in a directory.
-    """
-    s = expandall(s)
-    for c, d, files in os.walk(s):
-        for f in files:
-            s = os.path.join(c, f)
-            if os.path.islink(s): continue
-            if not include_hidden and is_hidden(s): continue
-            yield s
-
-
 def expandall(s:str) -> str:
     """
     Expand all the user vars into an absolute path name. If the
@@ -119,13 +129,40 @@ def expandall(s:str) -> str:
 
 
 
-def is_hidden(path:str) -> bool:
+@trap
+def load_dirs(db:SQLiteDB, myargs:argparse.Namespace) -> int:
     """
-    returns True if the path is hidden
+    undeux --load: walk the directories straight into the metadata
+    table, block by block, with the inserts overlapping the walk.
+    Nothing is hashed; calchashes.py does that. A database without
+    a metadata table is given the whole undeux schema first, and the
+    rows from an earlier load of the same directories are marked
+    deleted, so that loading again replaces them.
     """
-    return True if "/." in path else False
-
-
+    if not db.execute_SQL("PRAGMA table_info(metadata);"):
+        undeuxdb.build_schema(myargs.db)
+    rescan.prepare(db)
+    excluder = exclude.Excluder(myargs.exclude)
+    start = time.perf_counter()
+    rows = replaced = 0
+    for dir in myargs.dirs:
+        if not os.path.isdir(dir):
+            logger.error(f"{dir} is not a directory; cannot load it.")
+            continue
+        replaced += undeuxdb.forget_tree(db, fileutils.expandall(dir))
+        rows += undeuxdb.load_files(db,
+            fsgenerators.block_of_files(dir, myargs.load_block, myargs.walkers, excluder))
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"{rows} files loaded in {elapsed:.1f}s; {rows/elapsed:.0f} files/s.")
+    logger.info(f"{replaced} rows from an earlier load marked deleted.")
+    logger.info(f"{excluder.pruned_dirs} excluded directories pruned, "
+        f"{excluder.pruned_entries} hidden entries skipped.")
+
+    totals = partition.assign_buckets(db)
+    logger.info(f"buckets assigned; the largest holds {max(totals)} bytes, the smallest {min(totals)}.")
+    logger.info(f"peak RSS was {candidates.peak_rss_mb():.1f} MB.")
+    return os.EX_OK
 
 
 @trap
@@ -146,102 +183,247 @@ def undeux_main(myargs:argparse.Namespace) -> int:
     ###
     table_name = os.path.split(myargs.dirs[0])[-1][-20:] + date.today().strftime("%Y%m%d")
 
-    logger.info('scan begun')
-    data=collections.defaultdict(list)
-    unusable = too_small = linked = 0
+    ###
+    # Get the database open. The incremental scan needs it before
+    # anything else happens.
+    ###
+    db = SQLiteDB(myargs.db)
+    if not db:
+        logger.error('Unable to open database.')
+        return os.EX_DATAERR
+
+    if myargs.load: return load_dirs(db, myargs)
+    if myargs.hogs is not None: return hogs.report(db, myargs.hogs, myargs.top)
 
+    ###
+    # Hidden entries, and directories matching any --exclude fragment,
+    # are dropped as each directory is listed, so the walk never
+    # descends into them. With --incremental, the directories that
+    # have not changed since the last run are not listed at all, and
+    # their files come from the database.
+    ###
+    excluder = exclude.Excluder(myargs.exclude)
+    if myargs.incremental:
+        lister = incremental = rescan.IncrementalLister(db, myargs.include_hidden, excluder)
+    else:
+        incremental = None
+        lister = functools.partial(walker.list_directory,
+            include_hidden=myargs.include_hidden, exclude=excluder)
+
+    roots = []
     for dir in myargs.dirs:
         if not os.path.isdir(dir):
             logger.error(f"{dir} is not a directory; cannot scan it.")
             continue
+        roots.append(expandall(dir))
 
-        for i, f in enumerate(all_files_in(dir)):
-            if not i % myargs.progress: print('.', end='', flush=True)
-            info=fileclass.FileClass(f)
+    ###
+    # With checkpoints, a run over the same directories that did not
+    # finish is resumed, with the table it was writing.
+    ###
+    ckpt = None
+    if myargs.checkpoint:
+        ckpt = checkpoint.Checkpoint(db, roots, table_name, myargs.checkpoint, fresh=myargs.fresh)
+        table_name = ckpt.table_name
+        if ckpt.resumed:
+            logger.info(f"resuming the run that is writing {table_name}, in its {ckpt.phase} phase.")
+
+    ###
+    # Large files may be hashed from a memory map. The best threshold
+    # depends on the filesystem; python fileclass.py --bench will help
+    # you choose one.
+    ###
+    if myargs.mmap_threshold:
+        fileclass.FileClass.MMAP_THRESHOLD = myargs.mmap_threshold << 20
+    iohints.enabled = myargs.fadvise
 
-            if not info.usable: unusable += 1; continue
-            if info.inodedata.st_size < myargs.big_file: too_small += 1; continue
-            if info.links > 1: linked +=1; continue
+    logger.info('scan begun')
+    data = (extsort.SpillIndex(myargs.spill << 20, myargs.spill_dir)
+        if myargs.spill else candidates.CandidateIndex())
+    scanned = unusable = too_small = linked = 0
 
-            data[int(info)].append(repr(info))
+    ###
+    # With --keep-hard-links, the links to an inode are collapsed to
+    # the first one found, which is the only one hashed. Otherwise,
+    # files with more than one link are left out.
+    ###
+    links = candidates.InodeGroups() if myargs.keep_hard_links else None
+
+    if ckpt is not None and ckpt.resumed:
+        for f, st in ckpt.stored_files():
+            if st.st_nlink > 1:
+                linked += 1
+                if links is None or not links.add(f, st): continue
+            data.add(f, st)
+        if incremental is not None: incremental.visited.update(ckpt.finished_dirs())
+
+    if ckpt is None or ckpt.phase == 'walk':
+        walk_lister = lister
+        if ckpt is not None:
+            roots = ckpt.frontier()
+            walk_lister = ckpt.lister(lister)
+
+        for f, st in walker.scan_tree(roots, myargs.walkers, lister=walk_lister):
+            if not scanned % myargs.progress: print('.', end='', flush=True, file=sys.stderr)
+            scanned += 1
+            if ckpt is not None: ckpt.tick()
+
+            if st is None: unusable += 1; continue
+            if st.st_size < myargs.big_file: too_small += 1; continue
+            if ckpt is not None: ckpt.keep(f, st)
+            if st.st_nlink > 1:
+                linked += 1
+                if links is None or not links.add(f, st): continue
+
+            data.add(f, st)
+
+        if ckpt is not None: ckpt.begin_hashing()
 
     logger.info('scan finished')
-    logger.info(f"scanned {i} directory entries.")
-    logger.info(f"{len(data)} distinct lengths.")
+    if incremental is not None:
+        counts = incremental.finish(expandall(d) for d in myargs.dirs)
+        logger.info(f"{counts['skipped']} unchanged directories skipped, "
+            f"{counts['relisted']} relisted, {counts['new']} new, {counts['deleted']} deleted.")
+        logger.info(f"{counts['reused files']} files reused from the last scan.")
+    logger.info(f"scanned {scanned} directory entries.")
+    logger.info(f"{excluder.pruned_dirs} excluded directories pruned, "
+        f"{excluder.pruned_entries} hidden entries skipped.")
     logger.info(f"{linked} multiply linked files.")
+    if links is not None:
+        logger.info(f"{links.extra} hard links to {len(links.links)} inodes collapsed; "
+            f"{links.extra_bytes} bytes will not be read twice.")
     logger.info(f"{too_small} small files ignored.")
     logger.info(f"{unusable} files with unreadable metadata.")
 
     ###
-    # Unless the host where this program is being run is
-    # critically low in memory, the following is the
-    # fastest way to delete the keys that point to only
-    # one file.
+    # Remove the files that are the only ones of their size. The
+    # in-memory index rewrites its arrays in place, so there is never
+    # a second copy of the data; the spilling index does the same job
+    # while merging its sorted runs.
     #
     # This program adds a few facts to the logfile.
     ###
-    data = {k:v for k, v in data.items() if len(v) != 1}
-    logger.info(f"possible duplicates reduced to {len(data)} groups.")
-    cases = largest_group = bigk = 0
-    for k, v in data.items():
-        cases += len(v)
-        if len(v) > largest_group:
-            largest_group = len(v)
-            bigk = k
+    cases = data.drop_singletons()
+    bigk, largest_group = data.largest_group()
+    logger.info(f"{data.distinct_sizes} distinct lengths.")
+    logger.info(f"possible duplicates reduced to {data.group_count} groups.")
+    logger.info(f"peak RSS after the scan is {candidates.peak_rss_mb():.1f} MB.")
 
     ###
     # Maybe we got lucky? :-)
     ###
     logger.info(f"{cases} files needing further checks.")
-    if not cases: return os.EX_OK
+    if not cases:
+        data.close()
+        if ckpt is not None: ckpt.finish()
+        return os.EX_OK
 
     logger.info(f"largest group is for {bigk} and has {largest_group} members.")
     logger.info(f"beginning search for duplicates")
 
     ###
-    # Get the database open, and create the empty table. We will create
-    # the index AFTER the table is populated to speed the inserts.
+    # Create the empty table; its index is built by the writer after
+    # the table is populated. A run resumed while hashing keeps the
+    # table and the rows of the sizes it finished, and does not hash
+    # those sizes again.
     ###
-    db = SQLiteDB('undeux.db')
-    if not db:
-        logging.error('Unable to open database.')
-        return os.EX_DATAERR
+    groups = data.groups()
+    if ckpt is not None and ckpt.phase == 'hash' and ckpt.resumed:
+        db.execute_SQL(new_table_statement(table_name))
+        ckpt.forget_unfinished()
+        finished = ckpt.hashed_sizes()
+        logger.info(f"{len(finished)} sizes were finished before the restart.")
+        groups = ((k, v) for k, v in groups if k not in finished)
+    else:
+        db.execute_SQL(drop_table_statement(table_name))
+        db.execute_SQL(new_table_statement(table_name))
+
+    ###
+    # The files reused from unlisted directories are stat-ed again,
+    # now that we know which of them are candidates, so that a file
+    # rewritten in place is not given its old hashes.
+    ###
+    if incremental is not None: groups = incremental.refresh(groups)
 
     ###
-    # Parameterize all these table statements.
+    # Unless told otherwise, reuse the hashes of files that have
+    # not changed since an earlier run.
     ###
-    db.execute_SQL(drop_table_statement(table_name))
-    db.execute_SQL(new_table_statement(table_name))
-    insert=insert_statement(table_name)
+    if not myargs.no_cache:
+        fileclass.hash_cache = hashcache.HashCache(db, myargs.cache_runs)
 
     ###
     # k is essentially the bucket name, and v contains the
-    # items in the bucket.
+    # files in the bucket whose contents match, as shown by
+    # the progressive hashing stages. The rows are written in
+    # large transactions, and the index is built when the
+    # writer is closed.
     ###
     logger.info("writing to the database")
-    for k, v in data.items():
-        for f in v:
-            info_f = fileclass.FileClass(f)
-            ###
-            # These assignment statements allocate no space -- they
-            # only provide clarity.
-            ###
-            filename=str(info_f)
-            dirname=os.path.dirname(f)
-            bucket=k
-            try:
-                hash=info_f.fingerprint()
-            except:
-                hash='0000'
-            db.execute_SQL(insert, filename, dirname, bucket, hash, None)
-
-
-    logger.info("database updated.")
-    db.execute_SQL(index_statement(table_name))
-    logger.info("index created.")
+    stats = collections.Counter()
+    sched = scheduler.DeviceScheduler(myargs.readers,
+        scheduler.parse_device_readers(myargs.device_readers))
+    with sched, undeuxdb.BulkWriter(db, insert_statement(table_name),
+        indices=(index_statement(table_name),)) as writer:
+        on_batch = None if ckpt is None else lambda sizes : ckpt.hashed(sizes, writer)
+        for k, v in hashstages.duplicates(groups, myargs.samples, stats, sched,
+            read_order=myargs.read_order, compare_order=myargs.compare_order,
+            lockstep_max=myargs.lockstep, on_batch=on_batch):
+            for info_f in v:
+                ###
+                # These assignment statements allocate no space -- they
+                # only provide clarity. Every link to a duplicated inode
+                # is reported, with the inode, so that the report counts
+                # its bytes once.
+                ###
+                st = info_f.inodedata
+                for path in ([info_f.name] if links is None else links.paths(info_f)):
+                    filename=os.path.basename(path)
+                    dirname=os.path.dirname(path)
+                    bucket=k
+                    writer.add((filename, dirname, bucket, info_f.hash, info_f.full_hash,
+                        st.st_dev, st.st_ino))
+
+        data.close()
+        logger.info("database updated.")
+
+    if incremental is not None:
+        logger.info(f"{incremental.stats['changed files']} reused files had changed, and "
+            f"{incremental.stats['stale files']} had vanished or changed size; "
+            f"their directories will be listed next time.")
+    for stage in ('fingerprint', 'sampled', 'full', 'lockstep'):
+        logger.info(f"{stage} stage: {stats[stage+' files']} files, {stats[stage+' bytes']} bytes read, "
+            f"{stats[stage+' cached']} from the cache.")
+    stage_bytes = sum(stats[stage+' bytes'] for stage in ('fingerprint', 'sampled', 'full', 'lockstep'))
+    logger.info(f"{stats['duplicates']} confirmed duplicates after reading {stage_bytes} bytes; "
+        f"hashing every candidate would have read {stats['naive bytes']}.")
+    rates = [f"{stats['read bytes '+how] / stats['read seconds '+how] / (1<<20):.1f} MB/s in {how} order"
+        for how in dict.fromkeys((myargs.read_order, myargs.compare_order))
+        if how is not None and stats['read seconds '+how] and stats['read bytes '+how]]
+    if rates: logger.info("hashing read " + ", ".join(rates) + ".")
+    for dev, n in sched.calls.items():
+        logger.info(f"device {dev}: {n} files read.")
+    logger.info(f"{writer.rows} rows in {writer.commits} transactions at {writer.rate:.0f} rows/s.")
+    logger.info(f"index created in {writer.index_time:.1f} seconds.")
+    if (cache := fileclass.hash_cache) is not None:
+        logger.info(f"hash cache: {cache.hits} hits, {cache.misses} misses, {cache.stores} entries stored.")
+        logger.info(f"hash cache: {cache.evict()} entries not seen in {cache.keep_runs} runs evicted.")
     db.execute_SQL(false_positives(table_name))
     logger.info("false duplicates removed from consideration.")
 
+    ###
+    # The report goes to stdout, and so to -o/--output if given.
+    ###
+    if myargs.report:
+        totals = report.report(db, table_name, myargs.report)
+        logger.info(f"reported {totals['groups']} groups of {totals['files']} files; "
+            f"{totals['wasted']} bytes wasted.")
+    if ckpt is not None:
+        logger.info(f"{ckpt.saves} checkpoints took {ckpt.cost:.1f}s, "
+            f"{100*ckpt.overhead:.2f}% of the run.")
+        ckpt.finish()
+    logger.info(f"peak RSS was {candidates.peak_rss_mb():.1f} MB.")
+
     return os.EX_OK
 
 
@@ -269,8 +451,32 @@ if __name__ == "__main__":
         default=[fileutils.expandall(os.getcwd())],
         help="directories to investigate (if not *this* directory)")
 
+    parser.add_argument('--checkpoint', type=int, default=0,
+        help=f"Save progress at most every this many seconds, and resume an unfinished run of the same directories. Default is 0, i.e., never; {checkpoint.DEFAULT_INTERVAL} is reasonable.")
+
+    parser.add_argument('--db', type=str, default='undeux.db',
+        help="Name of the database. Default is undeux.db")
+
+    parser.add_argument('-x', '--exclude', action='append', default=[],
+        help="skip directories whose paths contain this fragment. May be repeated.")
+
+    parser.add_argument('--fadvise', action='store_true',
+        help="keep hashing from flooding the page cache, and read ahead the next file.")
+
+    parser.add_argument('--fresh', action='store_true',
+        help="with --checkpoint, discard any saved progress and start over.")
+
+    parser.add_argument('--hogs', type=int, default=None, choices=[0, *range(20, 34)],
+        help="only rank the files already in the database as candidates for removal, considering those of at least 2**hogs bytes (0 for all).")
+
+    parser.add_argument('--include-hidden', action='store_true',
+        help="look in hidden directories and at hidden files, which are skipped by default.")
+
+    parser.add_argument('--incremental', action='store_true',
+        help="skip listing directories unchanged since the last run, and reuse their stored files.")
+
     parser.add_argument('--keep-hard-links', action='store_true',
-        help="record rather than ignore files with multiple links.")
+        help="hash each multiply linked inode once, and report all of its paths, rather than ignore such files.")
 
     parser.add_argument('--log-level', type=int, default=INFO,
         choices=(CRITICAL, ERROR, WARNING, INFO, DEBUG, NOTSET),
@@ -279,14 +485,63 @@ if __name__ == "__main__":
     parser.add_argument('-y', '--just-do-it', action='store_true',
         help="run the program using the defaults.")
 
+    parser.add_argument('--load', action='store_true',
+        help="only load the files' metadata into the database, for calchashes.py to hash.")
+
+    parser.add_argument('--load-block', type=int, default=undeuxdb.DEFAULT_BATCH,
+        help=f"Files passed from the walk to the database at a time by --load. Default is {undeuxdb.DEFAULT_BATCH}")
+
+    parser.add_argument('--lockstep', type=int, default=compare.DEFAULT_LOCKSTEP,
+        help=f"Compare groups of this many files or fewer block by block instead of hashing them. Default is {compare.DEFAULT_LOCKSTEP}; 0 turns it off.")
+
+    parser.add_argument('--mmap-threshold', type=int, default=0,
+        help="Hash files of at least this many MB from a memory map. Default is 0, i.e., never.")
+
     parser.add_argument('--nice', type=int, default=20, choices=range(0, 21),
         help="by default, this program runs /very/ nicely at nice=20")
 
-    parser.add_argument('-o', '--output', default="")
+    parser.add_argument('-o', '--output', default="",
+        help="write stdout, including the --report, to this file.")
+
+    parser.add_argument('--read-order', choices=readorder.ORDERS, default='none',
+        help="Order of the reads on each device: as found, by path, by inode, or by physical extent. Default is none.")
+
+    parser.add_argument('--compare-order', choices=readorder.ORDERS, default=None,
+        help="Read every other batch in this order instead of --read-order, and log the MB/s of both; name is the usual baseline.")
+
+    parser.add_argument('--readers', type=int, default=scheduler.DEFAULT_READERS,
+        help=f"Number of files read concurrently on each device. Default is {scheduler.DEFAULT_READERS}")
+
+    parser.add_argument('--report', choices=report.FORMATS, default=None,
+        help="write the confirmed duplicate groups, largest first, in this format.")
+
+    parser.add_argument('--cache-runs', type=int, default=hashcache.DEFAULT_KEEP_RUNS,
+        help=f"Forget cached hashes of files not seen in this many runs. Default is {hashcache.DEFAULT_KEEP_RUNS}")
+
+    parser.add_argument('--no-cache', action='store_true',
+        help="Neither use nor update the persistent hash cache.")
+
+    parser.add_argument('--device-readers', action='append', default=[],
+        help="path=N, to allow N concurrent readers on the device holding path. May be repeated.")
+
+    parser.add_argument('--samples', type=int, default=fileclass.FileClass.SAMPLES,
+        help=f"Number of interior blocks hashed before resorting to a full hash. Default is {fileclass.FileClass.SAMPLES}")
+
+    parser.add_argument('--spill', type=int, default=0,
+        help="Group files by size on disc, using at most this many MB of memory for the sort. Default is 0, i.e., group in memory.")
+
+    parser.add_argument('--spill-dir', type=str, default=None,
+        help="Where to write the sorted runs when --spill is used. Default is $TMPDIR.")
+
+    parser.add_argument('--walkers', type=int, default=walker.DEFAULT_WALKERS,
+        help=f"Number of directories listed concurrently. Default is {walker.DEFAULT_WALKERS}")
 
     parser.add_argument('-p', '--progress', type=int, default=(1<<13)+1,
         help=f"Number of files scanned between proof-of-life messages. Default is {(1<<13)+1}")
 
+    parser.add_argument('--top', type=hogs.positive, default=hogs.DEFAULT_TOP,
+        help=f"Number of files reported by --hogs. Default is {hogs.DEFAULT_TOP}")
+
     parser.add_argument('-z', '--zap', action='store_true',
         help="remove old logfile[s]")
 
@@ -24,10 +24,28 @@ CREATE TABLE IF NOT EXISTS metadata (
     mtime datetime,
     atime datetime,
     bucket integer,
-    rowid integer primary key
+    rowid integer primary key,
+    device integer,
+    ctime datetime,
+    deleted integer default 0
     );
 
 CREATE INDEX size_idx on metadata(filesize);
+CREATE INDEX dir_idx on metadata(directory_name);
+
+-- The directories seen by an incremental scan. A directory whose
+-- inode and mtime still match is not listed again; its files are
+-- taken from metadata.
+DROP TABLE IF EXISTS directories;
+CREATE TABLE IF NOT EXISTS directories (
+    dirname text primary key,
+    parent text,
+    inode integer,
+    device integer,
+    mtime real,
+    deleted integer default 0 );
+
+CREATE INDEX parent_idx on directories(parent);
 
 -- This view shows files with multiple hard links.
 DROP VIEW IF EXISTS fake_duplicates;
@@ -35,28 +53,33 @@ CREATE VIEW fake_duplicates AS
     SELECT * FROM metadata WHERE nlinks > 1
         ORDER BY filename, directory_name;
 
+-- Every size shared by two or more files. It is rebuilt after the
+-- files are loaded, so the views and calchashes look sizes up here
+-- instead of grouping all of metadata on every query.
+DROP TABLE IF EXISTS size_groups;
+CREATE TABLE IF NOT EXISTS size_groups (
+    filesize integer primary key,
+    members integer );
+
+CREATE INDEX size_cover_idx on metadata(filesize, deleted);
+CREATE INDEX bucket_cover_idx on metadata(bucket, deleted, filesize);
+CREATE INDEX name_idx on metadata(filename);
+
 -- This view shows files with the same size.
 DROP VIEW IF EXISTS possible_duplicates;
 CREATE VIEW possible_duplicates AS 
-    SELECT t.* from metadata AS t
-        INNER JOIN (
-            SELECT filesize FROM metadata GROUP BY filesize 
-            HAVING COUNT(*) > 1 )
-        dups ON t.filesize = dups.filesize;
+    SELECT t.* from size_groups AS s
+        INNER JOIN metadata AS t ON t.filesize = s.filesize;
 
 -- This view shows files with the same size and same name from
 -- different directories. 
 DROP VIEW IF EXISTS probable_duplicates;
 CREATE VIEW probable_duplicates AS 
-    SELECT t.* from metadata AS t
-        INNER JOIN (
-            SELECT filesize FROM metadata GROUP BY filesize 
-            HAVING COUNT(*) > 1 )
-        dups ON t.filesize = dups.filesize
-        INNER JOIN (
-            SELECT filename FROM metadata GROUP BY filename
-            HAVING COUNT(*) > 1 )
-        samename ON t.filename = samename.filename;
+    SELECT t.* from size_groups AS s
+        INNER JOIN metadata AS t ON t.filesize = s.filesize
+        WHERE EXISTS (
+            SELECT 1 FROM metadata AS other
+            WHERE other.filename = t.filename AND other.rowid != t.rowid );
 
 
 DROP TABLE IF EXISTS hashes;
@@ -65,3 +88,49 @@ CREATE TABLE IF NOT EXISTS hashes (
     hash_size integer default 0,
     hash text );
 
+CREATE INDEX hash_cover_idx on hashes(file_id, hash);
+
+-- Every set of two or more files with the same size and hash. The
+-- rows for a size are rebuilt as soon as that size is hashed.
+DROP TABLE IF EXISTS dup_groups;
+CREATE TABLE IF NOT EXISTS dup_groups (
+    group_id integer primary key,
+    filesize integer,
+    hash text,
+    members integer,
+    wasted integer,
+    unique (filesize, hash) );
+
+CREATE INDEX dup_size_idx on dup_groups(filesize desc, group_id);
+
+-- The confirmed duplicates, one row per file.
+DROP VIEW IF EXISTS duplicates;
+CREATE VIEW duplicates AS
+    SELECT g.group_id, g.filesize, g.hash, g.members, g.wasted,
+        t.directory_name, t.filename, t.rowid AS file_id, t.device, t.inode
+    FROM dup_groups AS g
+        INNER JOIN metadata AS t ON t.filesize = g.filesize
+        INNER JOIN hashes AS h ON h.file_id = t.rowid AND h.hash = g.hash
+    WHERE NOT t.deleted;
+
+-- The persistent hash cache. It is not dropped when the schema is
+-- rebuilt, because the whole point is to survive from one run to
+-- the next. An entry is valid only while the file's size, mtime,
+-- and ctime still match.
+CREATE TABLE IF NOT EXISTS hash_cache_runs (
+    run_id integer primary key,
+    started datetime default current_timestamp );
+
+CREATE TABLE IF NOT EXISTS hash_cache (
+    device integer,
+    inode integer,
+    filesize integer,
+    mtime real,
+    ctime real,
+    fingerprint text,
+    fullhash text,
+    last_run integer,
+    primary key (device, inode) ) without rowid;
+
+CREATE INDEX IF NOT EXISTS hash_cache_run_idx on hash_cache(last_run);
+
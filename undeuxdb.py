@@ -22,6 +22,11 @@ import contextlib
 import getpass
 mynetid = getpass.getuser()
 import multiprocessing
+import queue
+import sqlite3
+import textwrap
+import threading
+import time
 
 ###
 # Installed libraries.
@@ -59,6 +64,180 @@ __license__ = 'MIT'
 
 lock_object = None
 
+###
+# Settings for a bulk load. WAL lets readers carry on while we
+# write, synchronous=NORMAL is crash-safe in WAL mode without an
+# fsync per commit, the negative cache_size is in KiB (256MB here),
+# and temp_store keeps the index build's sort out of /tmp.
+###
+LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY"
+    )
+
+###
+# WAL needs the readers and the writer to share memory through the
+# -shm file, which SQLite does not support on network filesystems.
+# A database on one of these keeps a rollback journal instead.
+###
+NETWORK_FILESYSTEMS = frozenset(('afs', 'beegfs', 'ceph', 'cifs', 'fuse.sshfs',
+    'gpfs', 'lustre', 'nfs', 'nfs4', 'panfs', 'smb3', 'smbfs'))
+NETWORK_JOURNAL = "PRAGMA journal_mode = DELETE"
+
+DEFAULT_BATCH = 50000
+
+###
+# Blocks of scanned files that may be waiting to be written.
+###
+DEFAULT_DEPTH = 4
+
+schema_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'undeux.sql')
+
+###
+# The rows loaded from a tree the last time, which are marked deleted
+# before it is loaded again. As in rescan.py, nothing is removed, so
+# no rowid is reused and no row in hashes comes to belong to another
+# file. The range keeps the search on dir_idx.
+###
+forget_tree_statement = textwrap.dedent("""
+    UPDATE metadata SET deleted = 1
+    WHERE NOT deleted AND (directory_name = ?
+        OR (directory_name >= ? AND directory_name < ?));
+    """).strip()
+
+
+class BulkWriter:
+    """
+    Buffer rows for an INSERT statement, and write them with
+    executemany, one transaction per batch. Any indices are built
+    when the writer is closed, after the table is populated.
+
+    with BulkWriter(db, SQL, indices=(index_SQL,)) as w:
+        for row in rows:
+            w.add(row)
+    print(f"{w.rows} rows at {w.rate} rows/s")
+    """
+
+    def __init__(self, db:sqlitedb.SQLiteDB,
+        SQL:str,
+        batch_size:int=DEFAULT_BATCH,
+        indices:Iterable[str]=(),
+        pragmas:Iterable[str]=None) -> None:
+        """
+        pragmas -- run before the first insert. Defaults to those
+            returned by load_pragmas(db).
+        """
+        self.db = db
+        self.SQL = SQL
+        self.batch_size = batch_size
+        self.indices = tuple(indices)
+        self.buffer = []
+        self.rows = 0
+        self.commits = 0
+        self.insert_time = 0.0
+        self.index_time = 0.0
+        for pragma in load_pragmas(db) if pragmas is None else pragmas:
+            db.execute_SQL(pragma)
+
+
+    def __enter__(self) -> object:
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.close()
+        return False
+
+
+    def add(self, row:tuple) -> None:
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_size: self.flush()
+
+
+    def add_many(self, rows:Iterable[tuple]) -> None:
+        for row in rows:
+            self.add(row)
+
+
+    def flush(self) -> None:
+        """
+        Write whatever is buffered as a single transaction.
+        """
+        if not self.buffer: return
+        start = time.perf_counter()
+        self.db.cursor.executemany(self.SQL, self.buffer)
+        self.db.commit()
+        self.insert_time += time.perf_counter() - start
+        self.rows += len(self.buffer)
+        self.commits += 1
+        self.buffer = []
+
+
+    def close(self) -> None:
+        """
+        Write the remainder, then build the indices.
+        """
+        self.flush()
+        start = time.perf_counter()
+        for index in self.indices:
+            self.db.execute_SQL(index)
+        self.index_time = time.perf_counter() - start
+        self.indices = ()
+
+
+    @property
+    def rate(self) -> float:
+        """
+        Insert throughput in rows per second, not counting the
+        time spent building indices.
+        """
+        return self.rows / self.insert_time if self.insert_time else 0.0
+
+
+def filesystem_of(path:str) -> str:
+    """
+    The type of the filesystem holding path, as /proc/mounts gives
+    it, or '' if it cannot be found.
+    """
+    path = os.path.realpath(path)
+    mount_point, fstype = '', ''
+    with contextlib.suppress(OSError):
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3: continue
+                mount = fields[1].replace('\\040', ' ')
+                if ((path == mount or path.startswith(os.path.join(mount, '')))
+                    and len(mount) > len(mount_point)):
+                    mount_point, fstype = mount, fields[2]
+    return fstype
+
+
+def load_pragmas(db:sqlitedb.SQLiteDB) -> tuple:
+    """
+    LOAD_PRAGMAS, with a rollback journal in place of WAL when the
+    database is on a network filesystem.
+    """
+    name = next((f for _, schema, f in db.execute_SQL("PRAGMA database_list;")
+        if schema == 'main'), '')
+    if not name or filesystem_of(name) not in NETWORK_FILESYSTEMS: return LOAD_PRAGMAS
+    return tuple(NETWORK_JOURNAL if 'journal_mode' in p else p for p in LOAD_PRAGMAS)
+
+
+def build_schema(dbname:str, *statements:str) -> None:
+    """
+    Run undeux.sql against dbname, which replaces any undeux tables
+    and views already there, and then the statements.
+    """
+    with open(schema_file) as f, contextlib.closing(sqlite3.connect(dbname)) as db:
+        db.executescript(f.read())
+        for statement in statements:
+            db.execute(statement)
+        db.commit()
+
+
 @trap
 def open_and_check_db(dbname:str, version_date:int) -> sqlitedb.SQLiteDB:
     """
@@ -94,10 +273,65 @@ def add_files(db:sqlitedb.SQLiteDB,
     """
     SQL = """
         INSERT INTO metadata 
-            (filename, directory_name, inode, nlinks, filesize, mtime, atime, bucket)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            (filename, directory_name, inode, nlinks, filesize, mtime, atime, bucket, device, ctime)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
-    db.cursor.executemany(SQL, data)
+    with BulkWriter(db, SQL) as writer:
+        writer.add_many(data)
+    return writer.rows
+
+
+@trap
+def forget_tree(db:sqlitedb.SQLiteDB, root:str) -> int:
+    """
+    Mark deleted the rows of the files in and beneath root, so that
+    loading root again replaces them rather than adding a second
+    copy of each.
+
+    returns -- the number of rows marked.
+    """
+    top = os.path.join(root, '')
+    db.cursor.execute(forget_tree_statement, (root, top, top[:-1] + '0'))
+    n = db.cursor.rowcount
     db.commit()
-    return db.cursor.rowcount
+    return n
+
+
+@trap
+def load_files(db:sqlitedb.SQLiteDB,
+    blocks:Iterable[list],
+    depth:int=DEFAULT_DEPTH) -> int:
+    """
+    Stream blocks of rows into the metadata table. The blocks are
+    produced in a separate thread (typically by walking the filesystem
+    with fsgenerators.block_of_files), and the rows are written by
+    add_files in this thread, so the walk and the inserts overlap.
+
+    blocks -- an iterable of lists of rows in the order add_files wants.
+    depth -- the number of blocks that may wait in the queue. Memory
+        is bounded by depth blocks plus the writer's batch.
+
+    returns -- the number of rows written.
+    """
+    q = queue.Queue(maxsize=depth)
+    failure = []
+
+    def produce() -> None:
+        try:
+            for block in blocks:
+                q.put(block)
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            q.put(None)
+
+    def consume() -> Iterator[tuple]:
+        while (block := q.get()) is not None:
+            yield from block
 
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    rows = add_files(db, consume())
+    producer.join()
+    if failure: raise failure[0]
+    return rows
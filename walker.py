@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+A directory walker built on os.scandir() that fans the listing of
+subdirectories out to a bounded pool of threads. The listing and
+stat-ing of directory entries are system calls that release the
+GIL, so several of them can be in flight at once on a parallel
+file system.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import collections
+import concurrent.futures
+import functools
+
+###
+# From hpclib
+###
+
+###
+# imports and objects that are a part of this project
+###
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2025'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+###
+# The number of threads listing directories at once. Local discs
+# are happy with a handful; Lustre and NFS reward a few dozen.
+###
+DEFAULT_WALKERS = 8
+
+
+def list_directory(d:str, include_hidden:bool=False, exclude:object=None) -> tuple:
+    """
+    Read one directory.
+
+    d -- the name of the directory.
+    include_hidden -- if False, skip entries whose names begin with a dot.
+    exclude -- an exclude.Excluder, or None. Excluded subdirectories
+        are not returned, so they are never listed.
+
+    returns -- (files, subdirs) where files is a list of (path, stat)
+        tuples for the regular files, and subdirs is a list of the
+        directories to visit next. The stat is None if the file's
+        metadata could not be read. Symbolic links are never followed,
+        and the entry types come from the directory listing itself,
+        so the only system call per file is the lstat.
+    """
+    files = []
+    subdirs = []
+    hidden = 0
+    try:
+        with os.scandir(d) as it:
+            for entry in it:
+                if not include_hidden and entry.name.startswith('.'):
+                    hidden += 1
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        try:
+                            files.append((entry.path, entry.stat(follow_symlinks=False)))
+                        except OSError:
+                            files.append((entry.path, None))
+                except OSError:
+                    continue
+
+    except OSError:
+        # Unreadable directories are not our problem to solve.
+        pass
+
+    if exclude is not None: subdirs = exclude.prune(subdirs, hidden)
+    return files, subdirs
+
+
+def scan_tree(roots:Union[str, Iterable[str]],
+    workers:int=DEFAULT_WALKERS,
+    include_hidden:bool=False,
+    lister:Callable=None,
+    exclude:object=None) -> Iterator[tuple]:
+    """
+    A generator that coughs up a (path, stat) tuple for every regular
+    file beneath the roots. The order is the order in which the
+    directory listings complete, not alphabetical.
+
+    roots -- a directory name or an iterable of them.
+    workers -- the number of directories being listed at once.
+    include_hidden -- if False, prune dot-files and dot-directories.
+    lister -- a replacement for list_directory, called with only the
+        directory's name. It runs in the worker threads and returns
+        (files, subdirs) like list_directory does. files may be any
+        iterable; it is consumed in the caller's thread.
+    exclude -- an exclude.Excluder for the default lister.
+    """
+    if isinstance(roots, str): roots = [roots]
+    workers = max(1, workers)
+    if lister is None: lister = functools.partial(list_directory,
+        include_hidden=include_hidden, exclude=exclude)
+
+    pending = collections.deque(roots)
+    in_flight = set()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or in_flight:
+            ###
+            # Keep no more than twice as many listings queued as there
+            # are threads. The rest of the frontier waits in the deque
+            # as plain strings, and taking the newest directory first
+            # makes the walk roughly depth-first, which keeps the
+            # frontier small on very wide trees.
+            ###
+            while pending and len(in_flight) < workers << 1:
+                in_flight.add(pool.submit(lister, pending.pop()))
+
+            done, in_flight = concurrent.futures.wait(in_flight,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                files, subdirs = future.result()
+                pending.extend(subdirs)
+                yield from files